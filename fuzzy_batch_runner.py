@@ -0,0 +1,247 @@
+"""Headless batch runner for many GFCM simulation jobs.
+
+    python fuzzy_batch_runner.py jobs.csv --out results.parquet --workers 8
+
+The manifest (CSV, JSON list or JSON lines) has one job per row with the
+fields `id`, `W`, `I` (omit when W is a .npz model), `lam`, `clamp`
+(';'-separated names in CSV), `iterations`, `tol` (early stop when set),
+`history`, `every` and `last`. Relative paths are resolved against the
+manifest's folder. Only numpy and pandas are imported.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from fuzzy_engine import clamp_mask, history_steps, simulate_history, simulate_until_stable
+from fuzzy_io import load_model, model_from_frames, read_table
+
+OUTPUT_FORMATS = ("csv", "parquet", "npz")
+JOB_DEFAULTS = {"I": None, "lam": 1.0, "clamp": (), "iterations": 15, "tol": None,
+                "history": "full", "every": 1, "last": 1}
+# Parsed models kept per worker, so jobs sharing a map parse it once
+MODELS_PER_WORKER = 8
+_MODELS = OrderedDict()
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and value.strip() == "")
+
+
+def _normalise_job(raw, base, k):
+    job = dict(JOB_DEFAULTS)
+    job.update({key: v for key, v in raw.items() if not _blank(v)})
+    job["id"] = str(job.get("id", k))
+    for key in ("W", "I"):
+        if job.get(key) is not None:
+            job[key] = str((base / job[key]) if not Path(job[key]).is_absolute() else Path(job[key]))
+    if "W" not in job:
+        raise ValueError(f"Job {job['id']}: no W file given.")
+    if isinstance(job["clamp"], str):
+        job["clamp"] = [c.strip() for c in job["clamp"].split(";") if c.strip()]
+    job["clamp"] = tuple(job["clamp"])
+    job["lam"] = float(job["lam"])
+    job["iterations"] = int(job["iterations"])
+    job["every"] = int(job["every"])
+    job["last"] = int(job["last"])
+    job["tol"] = None if job["tol"] is None else float(job["tol"])
+    return job
+
+
+def load_manifest(path):
+    """Read a CSV / JSON / JSON-lines manifest into a list of job dicts."""
+    path = Path(path)
+    text = path.read_text()
+    if path.suffix == ".csv":
+        rows = list(csv.DictReader(text.splitlines()))
+    elif path.suffix == ".jsonl":
+        rows = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        rows = json.loads(text)
+    return [_normalise_job(row, path.parent, k) for k, row in enumerate(rows)]
+
+
+def cached_model(W_path, I_path=None):
+    """Model read from a W/I file pair or a .npz path, kept in this process's LRU."""
+    key = (W_path, I_path)
+    if key not in _MODELS:
+        if W_path.endswith(".npz"):
+            _MODELS[key] = load_model(W_path)
+        else:
+            _MODELS[key] = model_from_frames(read_table(W_path), read_table(I_path))
+        while len(_MODELS) > MODELS_PER_WORKER:
+            _MODELS.popitem(last=False)
+    _MODELS.move_to_end(key)
+    return _MODELS[key]
+
+
+def run_job(job):
+    """Run one job and return its result dict (errors are captured, not raised)."""
+    start = time.perf_counter()
+    result = {"id": job["id"], "status": "error", "step": None, "period": None, "error": None}
+    try:
+        model = cached_model(job["W"], job["I"])
+        names = model["names"]
+        clamp = clamp_mask(names, job["clamp"])
+        if job["tol"] is not None:
+            fuzzy, crisp, info = simulate_until_stable(model["W"], model["I"], clamp, job["lam"],
+                                                       job["iterations"], job["tol"])
+            # Apply the history policy to the truncated run
+            steps = history_steps(info["step"], job["history"], job["every"], job["last"])
+            fuzzy, crisp = fuzzy[steps], crisp[steps]
+        else:
+            steps, fuzzy, crisp = simulate_history(model["W"], model["I"], clamp, job["lam"],
+                                                   job["iterations"], job["history"],
+                                                   job["every"], job["last"])
+            info = {"status": "completed", "step": job["iterations"], "period": None}
+        result.update(info, names=names, steps=steps, fuzzy=fuzzy, crisp=crisp)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def tidy_frame(result):
+    """Long-format table of one job result: one row per (step, concept)."""
+    names, steps, fuzzy = result["names"], result["steps"], result["fuzzy"]
+    n = len(names)
+    return pd.DataFrame({
+        "job_id": result["id"],
+        "step": np.repeat(steps, n),
+        "concept": np.tile(np.array([str(c) for c in names], dtype=object), len(steps)),
+        "lo": fuzzy[..., 0].ravel(),
+        "mid": fuzzy[..., 1].ravel(),
+        "hi": fuzzy[..., 2].ravel(),
+        "centroid": result["crisp"].ravel(),
+    })
+
+
+class _Writer:
+    """Appends job results to a CSV file, a Parquet file or a folder of .npz files."""
+
+    def __init__(self, out, fmt):
+        self.out = Path(out)
+        self.fmt = fmt
+        self.parquet = None
+        self.header = True
+        if fmt == "npz":
+            self.out.mkdir(parents=True, exist_ok=True)
+            summary = self.out / "summary.csv"
+        else:
+            self.out.parent.mkdir(parents=True, exist_ok=True)
+            summary = self.out.with_suffix(".summary.csv")
+            if fmt == "csv":
+                self.out.write_text("")
+        self.summary = open(summary, "w", newline="")
+        self.summary_csv = csv.writer(self.summary)
+        self.summary_csv.writerow(["job_id", "status", "step", "period", "n", "seconds", "error"])
+
+    def write(self, result):
+        ok = result["error"] is None
+        self.summary_csv.writerow([result["id"], result["status"], result["step"], result["period"],
+                                   len(result["names"]) if ok else None,
+                                   f"{result['seconds']:.4f}", result["error"]])
+        self.summary.flush()
+        if not ok:
+            return
+        if self.fmt == "npz":
+            np.savez(self.out / f"{result['id']}.npz",
+                     names=np.array([str(c) for c in result["names"]], dtype=str),
+                     steps=result["steps"], fuzzy=result["fuzzy"], crisp=result["crisp"],
+                     info=np.array(json.dumps({k: result[k] for k in ("status", "step", "period")})))
+            return
+        frame = tidy_frame(result)
+        if self.fmt == "csv":
+            with open(self.out, "a", newline="") as fh:
+                frame.to_csv(fh, header=self.header, index=False)
+            self.header = False
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self.parquet is None:
+                self.parquet = pq.ParquetWriter(self.out, table.schema)
+            self.parquet.write_table(table)
+
+    def close(self):
+        if self.parquet is not None:
+            self.parquet.close()
+        self.summary.close()
+
+
+def run_batch(jobs, out, fmt="csv", workers=None, max_pending=None, progress=None):
+    """Run jobs across a process pool and write each result as it finishes.
+
+    At most `max_pending` jobs (twice the worker count by default) are in
+    flight, so memory stays bounded however long the manifest is. Returns
+    the number of jobs that failed.
+    """
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format {fmt!r}; expected one of {OUTPUT_FORMATS}.")
+    if fmt == "parquet":
+        import pyarrow.parquet  # noqa: F401  fail before any job runs
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * workers
+    writer = _Writer(out, fmt)
+    failed = done = 0
+    try:
+        if workers == 1:
+            results = map(run_job, jobs)
+        else:
+            results = _pooled(jobs, workers, max_pending)
+        for result in results:
+            writer.write(result)
+            failed += result["error"] is not None
+            done += 1
+            if progress:
+                progress(done, len(jobs), result)
+    finally:
+        writer.close()
+    return failed
+
+
+def _pooled(jobs, workers, max_pending):
+    queue = iter(jobs)
+    with ProcessPoolExecutor(workers) as pool:
+        pending = set()
+        for job in queue:
+            pending.add(pool.submit(run_job, job))
+            if len(pending) >= max_pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from (f.result() for f in finished)
+        for future in pending:
+            yield future.result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a manifest of GFCM simulations headlessly.")
+    parser.add_argument("manifest", help="CSV, JSON or JSON-lines job manifest")
+    parser.add_argument("--out", required=True, help="output file (csv/parquet) or folder (npz)")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default=None,
+                        help="output format (default: from the --out suffix, else npz)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or {".csv": "csv", ".parquet": "parquet"}.get(Path(args.out).suffix, "npz")
+    jobs = load_manifest(args.manifest)
+
+    def progress(done, total, result):
+        if not args.quiet:
+            state = result["error"] or f"{result['status']} at step {result['step']}"
+            print(f"[{done}/{total}] {result['id']}: {state} ({result['seconds']:.2f}s)", file=sys.stderr)
+
+    failed = run_batch(jobs, args.out, fmt, args.workers, progress=progress)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
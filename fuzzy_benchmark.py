@@ -0,0 +1,273 @@
+"""Reproducible benchmarks of the GFCM parse, simulate, metrics, figure and export paths.
+
+    python fuzzy_benchmark.py --sizes 10 100 1000 --out bench.json
+    python fuzzy_benchmark.py --sizes 10 100 1000 --baseline bench.json --threshold 0.25
+
+Synthetic maps are generated from a seed with a given size, edge density and
+TFN spread. Each stage runs once to warm up caches and JIT compilation, once
+under tracemalloc for its peak memory, then `--repeat` timed runs (best and
+median are kept). Results are written as JSON. Against a baseline, any stage whose best time or peak memory
+grew by more than the threshold is reported and the exit status is 1.
+"""
+import argparse
+import importlib.util
+import io
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from fuzzy_engine import simulate
+from fuzzy_io import model_from_frames, read_table, save_model
+from fuzzy_sparse import sparse_to_dense, sparse_weights_from_coo
+
+STAGES = ("parse", "reference", "simulate", "metrics", "figure", "export")
+# Largest map each stage is run on (parse/export need dense W); bigger sizes are recorded as skipped
+STAGE_MAX_N = {"parse": 2000, "reference": 100, "simulate": None, "metrics": None,
+               "figure": None, "export": 2000}
+# Dense W is built up to this size; larger maps run on the sparse engine
+DENSE_MAX_N = 2000
+# Concepts drawn in the figure stage, and the point budget of that figure
+FIGURE_CONCEPTS = 200
+FIGURE_MAX_POINTS = 200_000
+# Above this size the metrics stage uses sampled centrality with this budget
+METRICS_EXACT_MAX_N = 1000
+METRICS_EPSILON = 0.1
+# Best times below this are too noisy to call a slowdown
+MIN_SECONDS = 0.01
+# The export stage also renders the PNG when Kaleido is installed
+HAVE_KALEIDO = importlib.util.find_spec("kaleido") is not None
+
+
+def synthetic_tfns(rng, size, spread):
+    """`size` random TFNs in [-1, 1] with lo/hi up to `spread` either side of mid."""
+    mid = rng.uniform(-1, 1, size)
+    return np.clip(np.column_stack([mid - spread * rng.random(size), mid,
+                                    mid + spread * rng.random(size)]), -1, 1)
+
+
+def synthetic_model(n, density=0.1, spread=0.2, seed=0):
+    """Random map with about density·n·(n-1) edges: (names, SparseWeights, X0)."""
+    rng = np.random.default_rng(seed)
+    m = int(round(density * n * (n - 1)))
+    flat = np.unique(rng.integers(0, n * n, size=int(m * 1.1) + 1))
+    flat = flat[flat // n != flat % n]
+    flat = rng.permutation(flat)[:m]
+    Ws = sparse_weights_from_coo(n, flat // n, flat % n, synthetic_tfns(rng, len(flat), spread))
+    return [f"c{k}" for k in range(n)], Ws, synthetic_tfns(rng, n, spread)
+
+
+def _cell_text(tfns):
+    return np.array([f"{lo:.6g}, {mid:.6g}, {hi:.6g}" for lo, mid, hi in tfns.tolist()], dtype=object)
+
+
+def synthetic_csv(names, W, X0):
+    """CSV bytes of the W and I tables, as they would be uploaded."""
+    n = len(names)
+    cells = np.full((n, n), "0", dtype=object)
+    i, j = np.nonzero(np.any(W != 0, axis=2))
+    cells[i, j] = _cell_text(W[i, j])
+    W_csv = pd.DataFrame(cells, index=names, columns=names).to_csv().encode()
+    I_csv = pd.DataFrame([_cell_text(X0)], index=["I"], columns=names).to_csv().encode()
+    return W_csv, I_csv
+
+
+def _stage_parse(ctx):
+    return model_from_frames(read_table(io.BytesIO(ctx["W_csv"]), "W.csv"),
+                             read_table(io.BytesIO(ctx["I_csv"]), "I.csv"))
+
+
+def _stage_reference(ctx):
+    from fuzzy_pipeline import fuzzy_pipeline
+    return fuzzy_pipeline(read_table(io.BytesIO(ctx["W_csv"]), "W.csv"),
+                          read_table(io.BytesIO(ctx["I_csv"]), "I.csv"),
+                          iterations=ctx["iterations"])
+
+
+def _stage_simulate(ctx):
+    ctx["fuzzy"], ctx["crisp"] = simulate(ctx["W"], ctx["X0"], iterations=ctx["iterations"],
+                                          dtype=ctx["dtype"])
+
+
+def _stage_metrics(ctx):
+    from fuzzy_metrics import graph_metrics
+    eps = None if ctx["n"] <= METRICS_EXACT_MAX_N else METRICS_EPSILON
+    return graph_metrics(ctx["W"], ctx["names"], epsilon=eps, seed=0, processes=ctx["processes"])
+
+
+def _figure(ctx):
+    from plot_fuzzy_3D_triangle_evolution import plot_fuzzy_triangle_evolution_with_centroids
+    shown = ctx["names"][:FIGURE_CONCEPTS]
+    data = {c: ctx["fuzzy"][:, k] for k, c in enumerate(shown)}
+    return plot_fuzzy_triangle_evolution_with_centroids(data, iterations=ctx["iterations"],
+                                                        max_points=FIGURE_MAX_POINTS)
+
+
+def _stage_figure(ctx):
+    return _figure(ctx).to_json()
+
+
+def _stage_export(ctx):
+    # Everything the app's download buttons produce: model, history CSV, 3D HTML and PNG
+    buf = io.BytesIO()
+    save_model(buf, ctx["names"], ctx["W"], ctx["X0"])
+    hist = pd.DataFrame(ctx["crisp"], columns=ctx["names"])
+    fig = _figure(ctx)
+    html = io.StringIO()
+    fig.write_html(html)
+    size = buf.getbuffer().nbytes + len(hist.to_csv()) + len(html.getvalue())
+    if HAVE_KALEIDO:
+        png = io.BytesIO()
+        fig.write_image(png, format="png")
+        size += png.getbuffer().nbytes
+    return size
+
+
+_STAGE_RUNNERS = {"parse": _stage_parse, "reference": _stage_reference, "simulate": _stage_simulate,
+                  "metrics": _stage_metrics, "figure": _stage_figure, "export": _stage_export}
+
+
+def _measure(fn, ctx, repeat):
+    # Warm-up (caches, JIT compilation), then memory in a separate untimed run
+    fn(ctx)
+    tracemalloc.start()
+    try:
+        fn(ctx)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(ctx)
+        times.append(time.perf_counter() - start)
+    return {"best": min(times), "median": float(np.median(times)), "peak_mb": peak / 1024 ** 2}
+
+
+def run_benchmarks(sizes, density=0.1, spread=0.2, iterations=15, repeat=3, stages=STAGES,
+                   seed=0, processes=1, dtype="float64", progress=None):
+    """Time every stage on a synthetic map of each size; returns a list of result dicts.
+
+    Stages always run in pipeline order (simulate feeds figure and export).
+    """
+    results = []
+    for n in sizes:
+        names, Ws, X0 = synthetic_model(n, density, spread, seed)
+        ctx = {"n": n, "names": names, "X0": X0, "iterations": iterations, "processes": processes,
+               "dtype": np.dtype(dtype),
+               "W": sparse_to_dense(Ws) if n <= DENSE_MAX_N else Ws}
+        if any(s in stages and n <= (STAGE_MAX_N[s] or n) for s in ("parse", "reference")):
+            ctx["W_csv"], ctx["I_csv"] = synthetic_csv(names, sparse_to_dense(Ws), X0)
+        needed = set(stages) | ({"simulate"} if {"figure", "export"} & set(stages) else set())
+        for stage in STAGES:
+            if stage not in needed:
+                continue
+            row = {"n": n, "density": density, "spread": spread, "stage": stage,
+                   "iterations": iterations, "repeat": repeat, "dtype": dtype}
+            if stage == "export":
+                row["png"] = HAVE_KALEIDO
+            limit = STAGE_MAX_N[stage]
+            if limit and n > limit:
+                row["skipped"] = f"n > {limit}"
+            else:
+                row.update(_measure(_STAGE_RUNNERS[stage], ctx, repeat))
+            if stage in stages:
+                results.append(row)
+                if progress:
+                    progress(row)
+    return results
+
+
+def _key(row):
+    return (row["n"], row["density"], row["spread"], row["stage"], row.get("dtype", "float64"),
+            row.get("png", False))
+
+
+def compare(results, baseline, threshold=0.25):
+    """Rows of (stage, n, baseline/current time and memory, ratios, regressed flag).
+
+    A stage regresses when its best time or peak memory exceeds the baseline
+    by more than `threshold` (a fraction); times both under MIN_SECONDS are
+    not compared.
+    """
+    base = {_key(r): r for r in baseline if "best" in r}
+    rows = []
+    for r in results:
+        b = base.get(_key(r))
+        if b is None or "best" not in r:
+            continue
+        noisy = max(r["best"], b["best"]) < MIN_SECONDS
+        time_ratio = r["best"] / b["best"] if b["best"] > 0 and not noisy else 1.0
+        mem_ratio = r["peak_mb"] / b["peak_mb"] if b["peak_mb"] > 0 else 1.0
+        rows.append({"stage": r["stage"], "n": r["n"], "density": r["density"], "spread": r["spread"],
+                     "base_s": b["best"], "best_s": r["best"], "time_ratio": time_ratio,
+                     "base_mb": b["peak_mb"], "peak_mb": r["peak_mb"], "mem_ratio": mem_ratio,
+                     "regressed": time_ratio > 1 + threshold or mem_ratio > 1 + threshold})
+    return pd.DataFrame(rows)
+
+
+def environment():
+    """Versions and machine details stored alongside results."""
+    import networkx
+    from fuzzy_kernels import compiled_available, numba
+    return {"timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(), "numpy": np.__version__,
+            "pandas": pd.__version__, "networkx": networkx.__version__,
+            "numba": numba.__version__ if compiled_available() else None,
+            "kaleido": HAVE_KALEIDO,
+            "machine": platform.machine(), "platform": platform.platform()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the GFCM pipeline on synthetic maps.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--density", type=float, default=0.1, help="fraction of possible edges present")
+    parser.add_argument("--spread", type=float, default=0.2, help="max distance of lo/hi from mid")
+    parser.add_argument("--iterations", type=int, default=15)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--processes", type=int, default=1, help="worker processes for the metrics stage")
+    parser.add_argument("--dtype", choices=("float64", "float32"), default="float64",
+                        help="precision of the simulate stage")
+    parser.add_argument("--out", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed slowdown / memory growth before a regression (fraction)")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    def progress(row):
+        if args.quiet:
+            return
+        if "skipped" in row:
+            print(f"n={row['n']:>6} {row['stage']:<10} skipped ({row['skipped']})", file=sys.stderr)
+        else:
+            print(f"n={row['n']:>6} {row['stage']:<10} best {row['best']:.4f}s "
+                  f"median {row['median']:.4f}s peak {row['peak_mb']:.1f} MB", file=sys.stderr)
+
+    results = run_benchmarks(args.sizes, args.density, args.spread, args.iterations, args.repeat,
+                             args.stages, args.seed, args.processes, args.dtype, progress)
+    if args.out:
+        with open(args.out, "w") as fh:
+            json.dump({"environment": environment(), "results": results}, fh, indent=2)
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)["results"]
+        table = compare(results, baseline, args.threshold)
+        if not table.empty:
+            print(table.to_string(index=False, float_format=lambda v: f"{v:.4g}"))
+        if not table.empty and table["regressed"].any():
+            print(f"{int(table['regressed'].sum())} stage(s) regressed by more than "
+                  f"{args.threshold:.0%}.", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from fuzzy_profile import stage as profile_stage
+
+# Default memory bound of a StageCache
+DEFAULT_MAX_BYTES = 512 * 1024 ** 2
+
+
+def make_key(*parts):
+    """Stable hex key for a mix of primitives, sequences, dicts and arrays.
+
+    Arrays are hashed by dtype, shape and contents, so equal inputs give
+    equal keys across reruns.
+    """
+    h = hashlib.sha256()
+
+    def feed(part):
+        if isinstance(part, np.ndarray):
+            h.update(f"nd{part.dtype.str}{part.shape}".encode())
+            h.update(np.ascontiguousarray(part).tobytes())
+        elif isinstance(part, (list, tuple)):
+            h.update(f"seq{len(part)}(".encode())
+            for p in part:
+                feed(p)
+            h.update(b")")
+        elif isinstance(part, dict):
+            feed(sorted(part.items(), key=lambda kv: repr(kv[0])))
+        else:
+            h.update(f"{type(part).__name__}:{part!r};".encode())
+
+    for part in parts:
+        feed(part)
+    return h.hexdigest()
+
+
+def estimate_nbytes(obj, _seen=None):
+    """Rough memory footprint of a cached value."""
+    _seen = set() if _seen is None else _seen
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if hasattr(obj, "memory_usage") and hasattr(obj, "columns"):
+        return int(obj.memory_usage(deep=True).sum())
+    if hasattr(obj, "to_plotly_json"):
+        return estimate_nbytes(obj.to_plotly_json(), _seen)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(estimate_nbytes(k, _seen) + estimate_nbytes(v, _seen)
+                                        for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set)):
+        return sys.getsizeof(obj) + sum(estimate_nbytes(v, _seen) for v in obj)
+    return sys.getsizeof(obj)
+
+
+class StageCache:
+    """Memory-bounded LRU memo of pipeline stages.
+
+    Entries are addressed by (stage, key), so each stage (simulation,
+    metrics, layout, figures, ...) is memoised separately and only the
+    stages whose inputs changed are recomputed. Least recently used entries
+    are evicted once the estimated total size exceeds `max_bytes`.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+
+    def get(self, stage, key, compute):
+        """Return the cached value for (stage, key), computing it on a miss.
+
+        Misses are recorded as a profiling stage of the same name.
+        """
+        with self._lock:
+            if (stage, key) in self.entries:
+                self.entries.move_to_end((stage, key))
+                self.hits += 1
+                return self.entries[(stage, key)][0]
+        with profile_stage(stage):
+            value = compute()
+        self.put(stage, key, value)
+        return value
+
+    def lookup(self, stage, key, default=None):
+        """Cached value for (stage, key) without computing it on a miss."""
+        with self._lock:
+            if (stage, key) not in self.entries:
+                return default
+            self.entries.move_to_end((stage, key))
+            self.hits += 1
+            return self.entries[(stage, key)][0]
+
+    def put(self, stage, key, value):
+        size = estimate_nbytes(value)
+        with self._lock:
+            self.misses += 1
+            if (stage, key) in self.entries:
+                self.nbytes -= self.entries.pop((stage, key))[1]
+            if size > self.max_bytes:
+                return
+            self.entries[(stage, key)] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                self.nbytes -= self.entries.popitem(last=False)[1][1]
+
+    def clear(self, stage=None):
+        """Drop every entry, or only those of one stage."""
+        with self._lock:
+            for k in [k for k in self.entries if stage is None or k[0] == stage]:
+                self.nbytes -= self.entries.pop(k)[1]
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self.entries), "nbytes": self.nbytes,
+                    "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,426 @@
+from collections import deque
+
+import numpy as np
+
+from fuzzy_io import state_vector_from_frame, weight_tensor_from_frame
+from fuzzy_kernels import compiled_available, fused_multiply_sum
+from fuzzy_profile import profiled, stage
+
+# Upper bound on elements in the (rows, n, 9) endpoint-product buffer per block
+ROW_BLOCK_ELEMENTS = 4_000_000
+
+
+def weight_tensor(W_df):
+    """Parse an n×n DataFrame of TFN cells into an (n, n, 3) float array.
+
+    Columns are taken in the order of the index and the diagonal is set to
+    the unit self-weight (1.0, 1.0, 1.0), as in `fuzzy_pipeline`.
+    """
+    return weight_tensor_from_frame(W_df)
+
+
+def state_vector(I_df):
+    """Parse the first row of I into an (n, 3) float array."""
+    return state_vector_from_frame(I_df)
+
+
+def clamp_mask(names, clamp_concepts):
+    """Boolean mask over `names` marking the clamped concepts."""
+    clamp_concepts = set(clamp_concepts or ())
+    return np.array([c in clamp_concepts for c in names], dtype=bool)
+
+
+def clamp_masks(names, clamp_sets):
+    """Stack one clamp mask per scenario into a (B, n) boolean array."""
+    return np.array([clamp_mask(names, c) for c in clamp_sets], dtype=bool).reshape(-1, len(names))
+
+
+def defuzzify_array(X):
+    """Centroids of a (..., 3) array of TFNs."""
+    return (X[..., 0] + X[..., 1] + X[..., 2]) / 3.0
+
+
+def fuzzy_multiply_array(A, B):
+    """Elementwise fuzzy product of broadcastable (..., 3) TFN arrays.
+
+    All 9 endpoint products are formed at once and reduced to
+    (min, median, max), matching `fuzzy_pipeline.fuzzy_multiply`.
+    """
+    prods = A[..., :, None] * B[..., None, :]
+    prods = prods.reshape(prods.shape[:-2] + (9,))
+    out = np.empty(prods.shape[:-1] + (3,), dtype=prods.dtype)
+    out[..., 0] = prods.min(axis=-1)
+    out[..., 1] = np.partition(prods, 4, axis=-1)[..., 4]
+    out[..., 2] = prods.max(axis=-1)
+    return out
+
+
+def fuzzy_multiply_sum(W, X):
+    """Row sums of fuzzy products W[i, j] ⊗ X[j] as an (..., n, 3) array.
+
+    X is (n, 3) or carries leading batch dimensions (..., n, 3). Dense W goes
+    to the compiled fused kernel (`fuzzy_kernels`) when numba is installed,
+    otherwise it is processed in row blocks to bound memory; a
+    `fuzzy_sparse.SparseWeights` W is dispatched to the O(nnz) kernel.
+    Products keep the input precision and are accumulated in float64.
+    """
+    if hasattr(W, "indptr"):
+        from fuzzy_sparse import sparse_multiply_sum
+        return sparse_multiply_sum(W, X)
+    if compiled_available():
+        with stage("fused"):
+            return fused_multiply_sum(W, X)
+    batch = X.shape[:-2]
+    n = W.shape[0]
+    S = np.empty(batch + (n, 3), dtype=np.result_type(W.dtype, X.dtype))
+    rows = max(1, ROW_BLOCK_ELEMENTS // max(1, 9 * n * int(np.prod(batch))))
+    Xb = X[..., None, :, :]
+    for start in range(0, n, rows):
+        stop = min(n, start + rows)
+        with stage("multiply"):
+            prods = fuzzy_multiply_array(W[start:stop], Xb)
+        # Reduction over a non-inner axis accumulates j in order, like the reference loop
+        with stage("accumulate"):
+            S[..., start:stop, :] = prods.sum(axis=-2, dtype=np.float64)
+    return S
+
+
+def weights_as(W, dtype=np.float64):
+    """Dense or sparse W with elements of `dtype`, copying only when it differs."""
+    if hasattr(W, "indptr"):
+        return W._replace(values=W.values.astype(dtype, copy=False))
+    return np.asarray(W).astype(dtype, copy=False)
+
+
+@profiled("step")
+def fuzzy_step(W, X, lam=1.0, clamp=None, X0=None):
+    """One GFCM update: tanh(λ · Σ_j W[i, j] ⊗ X[j]) with clamped rows held at X0.
+
+    For batched states `lam` may be a (B,) array and `clamp` a (B, n) mask.
+    """
+    S = fuzzy_multiply_sum(W, X)
+    lam = np.asarray(lam, dtype=S.dtype)[..., None, None]
+    with stage("tanh"):
+        nxt = np.tanh(lam * S)
+    if clamp is not None and np.any(clamp):
+        with stage("clamp"):
+            nxt = np.where(clamp[..., None], X0, nxt)
+    return nxt
+
+
+@profiled("simulate")
+def simulate(W, X0, clamp=None, lam=1.0, iterations=15, dtype=np.float64):
+    """Run the GFCM on arrays; returns (iterations+1, n, 3) and (iterations+1, n) histories.
+
+    `dtype=np.float32` runs in single precision (see `fuzzy_kernels`).
+    """
+    W = weights_as(W, dtype)
+    X0 = np.asarray(X0, dtype=dtype)
+    hist = np.empty((iterations + 1,) + X0.shape, dtype=dtype)
+    hist[0] = X0
+    for t in range(iterations):
+        hist[t + 1] = fuzzy_step(W, hist[t], lam, clamp, X0)
+    return hist, defuzzify_array(hist)
+
+
+def iterate_states(W, X0, clamp=None, lam=1.0, iterations=15, dtype=np.float64):
+    """Yield (t, state) for t = 0..iterations without keeping any history.
+
+    Each yielded state is a fresh array, so callers may keep or stream it.
+    X0 may carry leading batch dimensions, as in `fuzzy_step`.
+    """
+    W = weights_as(W, dtype)
+    X0 = np.asarray(X0, dtype=dtype)
+    X = X0
+    yield 0, X
+    for t in range(iterations):
+        X = fuzzy_step(W, X, lam, clamp, X0)
+        yield t + 1, X
+
+
+HISTORY_POLICIES = ("full", "every", "last", "final")
+
+
+def history_steps(iterations, history="full", every=1, last=1):
+    """Step indices kept by a history policy (see `simulate_history`)."""
+    if history not in HISTORY_POLICIES:
+        raise ValueError(f"Unknown history policy {history!r}; expected one of {HISTORY_POLICIES}.")
+    if every < 1 or last < 1:
+        raise ValueError(f"Need every ≥ 1 and last ≥ 1, got every={every}, last={last}.")
+    if history == "full":
+        return np.arange(iterations + 1)
+    if history == "every":
+        return np.unique(np.append(np.arange(0, iterations + 1, every), iterations))
+    if history == "last":
+        return np.arange(max(0, iterations + 1 - last), iterations + 1)
+    return np.array([iterations])
+
+
+@profiled("simulate")
+def simulate_history(W, X0, clamp=None, lam=1.0, iterations=15, history="full", every=1, last=1,
+                     callback=None, dtype=np.float64):
+    """Run the GFCM keeping only the states selected by a history policy.
+
+    - "full": every state, in a preallocated array
+    - "every": every `every`-th state, plus the final one
+    - "last": a ring buffer of the `last` most recent states
+    - "final": the final state only
+
+    Returns (steps, fuzzy, crisp): the step index of each kept state and the
+    kept fuzzy states and centroids, time-major and in chronological order.
+    `callback(t, state)`, if given, is called for every state, kept or not.
+    """
+    steps = history_steps(iterations, history, every, last)
+    W = weights_as(W, dtype)
+    X0 = np.asarray(X0, dtype=dtype)
+    kept = np.empty((len(steps),) + X0.shape, dtype=dtype)
+    if history == "last":
+        # Ring buffer: state t lands in slot t % len(steps), rotated into order at the end
+        for t, X in iterate_states(W, X0, clamp, lam, iterations, dtype):
+            kept[t % len(steps)] = X
+            if callback:
+                callback(t, X)
+        kept = np.roll(kept, -(steps[0] % len(steps)), axis=0)
+    else:
+        slot = dict(zip(steps.tolist(), range(len(steps))))
+        for t, X in iterate_states(W, X0, clamp, lam, iterations, dtype):
+            if t in slot:
+                kept[slot[t]] = X
+            if callback:
+                callback(t, X)
+    return steps, kept, defuzzify_array(kept)
+
+
+@profiled("simulate_batch")
+def simulate_batch(W, X0, clamp=None, lam=1.0, iterations=15, dtype=np.float64):
+    """Advance B scenarios against one W together.
+
+    X0 is a (B, n, 3) stack of initial states, `clamp` an optional (B, n)
+    mask and `lam` a scalar or (B,) array. Returns (B, iterations+1, n, 3)
+    fuzzy and (B, iterations+1, n) crisp histories.
+    """
+    W = weights_as(W, dtype)
+    X0 = np.asarray(X0, dtype=dtype)
+    B = X0.shape[0]
+    if clamp is not None:
+        clamp = np.broadcast_to(np.asarray(clamp, dtype=bool), X0.shape[:-1])
+    lam = np.broadcast_to(np.asarray(lam, dtype=float), (B,))
+    hist = np.empty((B, iterations + 1) + X0.shape[1:], dtype=dtype)
+    hist[:, 0] = X0
+    for t in range(iterations):
+        hist[:, t + 1] = fuzzy_step(W, hist[:, t], lam, clamp, X0)
+    return hist, defuzzify_array(hist)
+
+
+def _state_key(X, tol):
+    """Hashable key of a state quantised to the tolerance grid."""
+    if tol > 0:
+        X = np.round(X / tol)
+    return hash(X.tobytes())
+
+
+@profiled("simulate")
+def simulate_until_stable(W, X0, clamp=None, lam=1.0, iterations=15, tol=1e-6, max_period=8,
+                          callback=None, dtype=np.float64):
+    """Run up to `iterations` steps, stopping once the answer is known.
+
+    The run stops at a fixed point when successive fuzzy states differ by at
+    most `tol` (max abs), or in a limit cycle when a state matches one of the
+    last `max_period` states. Recent states are looked up by a hash of the
+    state quantised to `tol` and confirmed by direct comparison.
+
+    Returns the truncated fuzzy and crisp histories and an info dict with
+    `status` ('fixed_point', 'cycle' or 'not_converged'), `step` (index of
+    the last state computed) and `period` (1 for a fixed point, k for a
+    period-k cycle, None otherwise). `callback(t, state)`, if given, is
+    called for every state as it is computed.
+    """
+    W = weights_as(W, dtype)
+    X0 = np.asarray(X0, dtype=dtype)
+    hist = np.empty((iterations + 1,) + X0.shape, dtype=dtype)
+    hist[0] = X0
+    if callback:
+        callback(0, hist[0])
+    recent = deque()
+    seen = {}
+    info = {"status": "not_converged", "step": iterations, "period": None}
+    for t in range(iterations):
+        key = _state_key(hist[t], tol)
+        recent.append(key)
+        seen.setdefault(key, []).append(t)
+        if len(recent) > max_period:
+            old = recent.popleft()
+            seen[old].pop(0)
+            if not seen[old]:
+                del seen[old]
+        hist[t + 1] = fuzzy_step(W, hist[t], lam, clamp, X0)
+        if callback:
+            callback(t + 1, hist[t + 1])
+        if np.max(np.abs(hist[t + 1] - hist[t]), initial=0.0) <= tol:
+            info = {"status": "fixed_point", "step": t + 1, "period": 1}
+            break
+        period = next((t + 1 - s for s in seen.get(_state_key(hist[t + 1], tol), ())
+                       if np.max(np.abs(hist[t + 1] - hist[s]), initial=0.0) <= tol), None)
+        if period:
+            info = {"status": "cycle", "step": t + 1, "period": period}
+            break
+    hist = hist[:info["step"] + 1]
+    return hist, defuzzify_array(hist), info
+
+
+# Past this fraction of changed columns, `resimulate` re-sums affected rows in full
+INCREMENTAL_MAX_FRACTION = 0.5
+
+
+@profiled("simulate")
+def simulate_cached(W, X0, clamp=None, lam=1.0, iterations=15):
+    """`simulate` that also keeps the pre-activation sums, for `resimulate`.
+
+    Returns a run dict with the inputs (`W`, `X0`, `clamp`, `lam`) and the
+    `fuzzy` (T+1, n, 3), `crisp` (T+1, n) and `sums` (T, n, 3) histories.
+    """
+    X0 = np.asarray(X0, dtype=float)
+    clamp = np.zeros(len(X0), dtype=bool) if clamp is None else np.asarray(clamp, dtype=bool)
+    hist = np.empty((iterations + 1,) + X0.shape)
+    sums = np.empty((iterations,) + X0.shape)
+    hist[0] = X0
+    for t in range(iterations):
+        sums[t] = fuzzy_multiply_sum(W, hist[t])
+        hist[t + 1] = np.where(clamp[:, None], X0, np.tanh(lam * sums[t]))
+    return {"W": W, "X0": X0, "clamp": clamp, "lam": lam,
+            "fuzzy": hist, "crisp": defuzzify_array(hist), "sums": sums}
+
+
+def _edited_weights(run, edges, add, remove):
+    """New W in the old index space plus one slot per added node, its edited entries and rewritten rows.
+
+    A removed or added node rewrites its own row of W, which is re-summed
+    outright; only its column and the explicitly edited entries are marked
+    in `changed`, so the other rows can still be adjusted incrementally.
+    """
+    W = np.asarray(run["W"], dtype=float)
+    n = len(W)
+    remove = np.atleast_1d(np.asarray(remove if remove is not None else [], dtype=np.intp))
+    keep = np.setdiff1d(np.arange(n), remove)
+    a = 0 if add is None else 1
+    N = n + a
+    Wn = np.zeros((N, N, 3)) if a else W.copy()
+    if a:
+        Wn[:n, :n] = W
+    changed = np.zeros((N, N), dtype=bool)
+    # Removed nodes: drop every influence they have on the rest
+    Wn[:, remove] = 0.0
+    Wn[remove, :] = 0.0
+    changed[:, remove] = True
+    index = np.append(keep, n) if a else keep
+    if a:
+        Wn[n, keep] = np.asarray(add.get("row", np.zeros((len(keep), 3))), dtype=float)
+        Wn[keep, n] = np.asarray(add.get("col", np.zeros((len(keep), 3))), dtype=float)
+        Wn[n, n] = 1.0
+        changed[:, n] = True
+    for (i, j), tfn in (edges or {}).items():
+        Wn[index[i], index[j]] = tfn
+        changed[index[i], index[j]] = True
+    rewritten = np.union1d(remove, np.arange(n, N))
+    return Wn, changed, index, remove, rewritten
+
+
+@profiled("resimulate")
+def resimulate(run, edges=None, clamp=None, add=None, remove=None):
+    """Update a `simulate_cached` run after a small edit without starting over.
+
+    Edits are applied in order: `remove` (index or indices of concepts to
+    drop), `add` (a dict with the new concept's `row` = W[new, :] and `col` =
+    W[:, new] TFNs over the remaining concepts, its initial TFN `x0` and
+    `clamp` flag; it is appended last), `edges` ({(i, j): (lo, mid, hi)} in
+    the resulting indices) and `clamp` (the new full mask).
+
+    At each step only concepts whose state differs from the previous run, or
+    whose column of W was edited, contribute: the cached sum of every row
+    they feed is adjusted by the new products minus the old ones (or re-summed
+    once most columns have changed), and all other rows reuse the cached sums
+    and states as they are. Dense W only. Returns a new run dict that agrees
+    with a full rerun to rounding.
+    """
+    if hasattr(run["W"], "indptr"):
+        raise ValueError("resimulate needs a run of dense W; expand SparseWeights with "
+                         "fuzzy_sparse.sparse_to_dense before simulate_cached.")
+    W_old = np.asarray(run["W"], dtype=float)
+    n = len(W_old)
+    Wn, changed, index, remove, rewritten = _edited_weights(run, edges, add, remove)
+    N = len(Wn)
+    a = N - n
+    lam = run["lam"]
+
+    def pad(A):
+        return np.concatenate([A, np.zeros((a,) + A.shape[1:])]) if a else A
+
+    X0 = pad(run["X0"])
+    old_clamp = np.append(run["clamp"], np.zeros(a, dtype=bool))
+    new_clamp = old_clamp.copy()
+    if a:
+        X0[n] = np.asarray(add.get("x0", (0.0, 0.0, 0.0)), dtype=float)
+        new_clamp[n] = bool(add.get("clamp", False))
+    if clamp is not None:
+        new_clamp[index] = np.asarray(clamp, dtype=bool)
+    new_clamp[remove] = False
+
+    edited_cols = np.flatnonzero(changed.any(axis=0))
+    # Rows whose state rule or whole row of W changed, whatever their inputs
+    retouch = np.union1d(np.flatnonzero(new_clamp != old_clamp), rewritten)
+    W_pad = np.zeros((N, N, 3)) if a else W_old
+    if a:
+        W_pad[:n, :n] = W_old
+    iterations = len(run["sums"])
+    hist = np.empty((iterations + 1, N, 3))
+    sums = np.empty((iterations, N, 3))
+    hist[0] = X0
+    # Rows fed by each column under the old or the new weights
+    feeds = np.any(W_pad != 0, axis=2) | np.any(Wn != 0, axis=2)
+    for t in range(iterations):
+        X_old, X_new = pad(run["fuzzy"][t]), hist[t]
+        dirty = np.flatnonzero(np.any(X_new != X_old, axis=1))
+        cols = np.union1d(dirty, edited_cols)
+        rows = np.flatnonzero(feeds[:, cols].any(axis=1))
+        S = pad(run["sums"][t]).copy()
+        if len(cols) > INCREMENTAL_MAX_FRACTION * N:
+            # Adjusting would cost more than summing the affected rows afresh
+            S[rows] = fuzzy_multiply_sum(Wn[rows], X_new)
+        elif len(rows):
+            Wc_old, Wc_new = W_pad[np.ix_(rows, cols)], Wn[np.ix_(rows, cols)]
+            S[rows] += (fuzzy_multiply_array(Wc_new, X_new[cols]).sum(axis=1)
+                        - fuzzy_multiply_array(Wc_old, X_old[cols]).sum(axis=1))
+        if len(rewritten):
+            S[rewritten] = fuzzy_multiply_sum(Wn[rewritten], X_new)
+        sums[t] = S
+        rows = np.union1d(rows, retouch)
+        hist[t + 1] = pad(run["fuzzy"][t + 1])
+        hist[t + 1][rows] = np.where(new_clamp[rows, None], X0[rows], np.tanh(lam * S[rows]))
+
+    keep = index
+    return {"W": Wn[np.ix_(keep, keep)], "X0": X0[keep], "clamp": new_clamp[keep], "lam": lam,
+            "fuzzy": hist[:, keep], "crisp": defuzzify_array(hist[:, keep]), "sums": sums[:, keep]}
+
+
+def fuzzy_pipeline_vectorized(W_df, I_df, clamp_concepts=None, lam=1.0, iterations=15):
+    """Array-backed equivalent of `fuzzy_pipeline.fuzzy_pipeline`.
+
+    Returns the fuzzy history as an (iterations+1, n, 3) array, the crisp
+    history as an (iterations+1, n) array and the concept names.
+    """
+    names = list(W_df.index)
+    W = weight_tensor(W_df)
+    X0 = state_vector(I_df)
+    fuzzy_hist, crisp_hist = simulate(W, X0, clamp_mask(names, clamp_concepts), lam, iterations)
+    return fuzzy_hist, crisp_hist, names
+
+
+def fuzzy_pipeline_until_stable(W_df, I_df, clamp_concepts=None, lam=1.0, iterations=15,
+                                tol=1e-6, max_period=8):
+    """`fuzzy_pipeline_vectorized` with early stopping; also returns the convergence info."""
+    names = list(W_df.index)
+    W = weight_tensor(W_df)
+    X0 = state_vector(I_df)
+    fuzzy_hist, crisp_hist, info = simulate_until_stable(
+        W, X0, clamp_mask(names, clamp_concepts), lam, iterations, tol, max_period)
+    return fuzzy_hist, crisp_hist, names, info
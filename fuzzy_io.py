@@ -0,0 +1,359 @@
+import csv
+import hashlib
+import io
+import itertools
+import json
+import os
+import struct
+import zipfile
+from contextlib import contextmanager
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from fuzzy_profile import profiled
+
+MODEL_FORMAT = "gfcm-model"
+MODEL_VERSION = 1
+MODEL_CACHE_SIZE = 4
+# Rows of a streamed W matrix formatted and written together
+EXPORT_CHUNK_ROWS = 256
+# Widest sheet Excel accepts; larger maps must be exported as CSV or an edge list
+XLSX_MAX_COLUMNS = 16384
+# Cell written for absent edges in matrix exports
+ZERO_TFN_CELL = "[0.0,0.0,0.0]"
+
+
+# Brackets and commas become spaces; whitespace bytes as seen by str.split on ASCII text
+_SEPARATORS = str.maketrans('()[],', '     ')
+_SPACE_BYTES = np.zeros(256, dtype=bool)
+_SPACE_BYTES[[9, 10, 11, 12, 13, 28, 29, 30, 31, 32]] = True
+_BRACKET_BYTES = np.zeros(256, dtype=bool)
+_BRACKET_BYTES[list(b'()[]')] = True
+
+
+def _tokens(cell):
+    # Same splitting as parse_interval: strip brackets, split on commas/whitespace
+    if isinstance(cell, (list, tuple, np.ndarray)):
+        return list(cell)
+    return str(cell).strip('()[]').replace(',', ' ').split()
+
+
+def _malformed(cells, labels=None):
+    """Positions and text of every cell `parse_interval` would reject."""
+    bad = []
+    for pos in np.ndindex(cells.shape):
+        toks = _tokens(cells[pos])
+        try:
+            [float(v) for v in toks]
+        except (TypeError, ValueError):
+            toks = None
+        if not toks:
+            where = tuple(labels[k][p] for k, p in enumerate(pos)) if labels else pos
+            bad.append(f"{where}: {cells[pos]!r}")
+    return bad
+
+
+def _tokenise_text(flat):
+    """Token counts and values of all cells from one pass over their joined text.
+
+    Returns None when the text needs per-cell handling (sequences, embedded
+    newlines, non-ASCII text or brackets that `str.strip` would keep).
+    """
+    if any(issubclass(t, (list, tuple, np.ndarray)) for t in set(map(type, flat))):
+        return None
+    text = "\n".join(map(str, flat))
+    if not text.isascii() or text.count("\n") != len(flat) - 1:
+        return None
+    if not text:
+        # A single empty cell: no tokens, reported as malformed by the caller
+        return np.zeros(len(flat), dtype=np.int64), np.empty(0)
+    b = np.frombuffer(text.encode("ascii"), dtype=np.uint8)
+    newline = b == 10
+    line = np.cumsum(newline)
+    # Brackets survive strip('()[]') unless only brackets lie between them and a cell edge
+    bracket = _BRACKET_BYTES[b]
+    other = np.cumsum(~bracket & ~newline)
+    edges = np.concatenate([[0], other[newline], [other[-1]]])
+    at = np.flatnonzero(bracket)
+    if ((other[at] != edges[line[at]]) & (other[at] != edges[line[at] + 1])).any():
+        return None
+    text = text.translate(_SEPARATORS)
+    space = _SPACE_BYTES[b] | bracket | (b == ord(','))
+    starts = ~space
+    starts[1:] &= space[:-1]
+    counts = np.bincount(line[starts], minlength=len(flat))
+    try:
+        vals = np.array(text.split(), dtype=float)
+    except ValueError:
+        return None
+    return counts, vals
+
+
+def _tokenise_cells(flat):
+    """Token counts and values, one cell at a time."""
+    toks = [_tokens(c) for c in flat]
+    counts = np.fromiter((len(t) for t in toks), dtype=np.int64, count=len(toks))
+    vals = np.fromiter((float(v) for t in toks for v in t), dtype=float, count=int(counts.sum()))
+    return counts, vals
+
+
+@profiled("parse")
+def parse_interval_array(cells, labels=None):
+    """Parse an array of TFN cells into a float array of shape cells.shape + (3,).
+
+    Gives the same values as calling `parse_interval` on every cell: one
+    value v becomes (v, v, v), two values (lo, hi) become (lo, (lo+hi)/2, hi)
+    and three or more keep the first three. All cells are tokenised in one
+    pass over their joined text; if any cell is malformed, a single
+    ValueError lists them all (by position, or by label when `labels` gives
+    one label list per axis).
+    """
+    cells = np.asarray(cells, dtype=object)
+    flat = cells.ravel()
+    if len(flat) == 0:
+        return np.empty(cells.shape + (3,))
+    try:
+        counts, vals = _tokenise_text(flat) or _tokenise_cells(flat)
+        if (counts == 0).any():
+            raise ValueError
+    except (TypeError, ValueError):
+        bad = _malformed(cells, labels)
+        raise ValueError(f"Cannot parse interval from {len(bad)} cell(s): " + "; ".join(bad))
+    start = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+    last = len(vals) - 1
+    first = vals[start]
+    second = vals[np.minimum(start + 1, last)]
+    third = vals[np.minimum(start + 2, last)]
+    out = np.empty((len(flat), 3))
+    out[:, 0] = first
+    out[:, 1] = np.where(counts == 1, first, np.where(counts == 2, (first + second) / 2.0, second))
+    out[:, 2] = np.where(counts == 1, first, np.where(counts == 2, second, third))
+    return out.reshape(cells.shape + (3,))
+
+
+@profiled("read_table")
+def read_table(file, name=None):
+    """Read a W or I table from CSV or XLSX with the concept labels as index."""
+    name = name or getattr(file, "name", str(file))
+    if str(name).endswith('.csv'):
+        return pd.read_csv(file, index_col=0)
+    return pd.read_excel(file, index_col=0)
+
+
+@profiled("build_W")
+def weight_tensor_from_frame(W_df):
+    """Bulk-parse an n×n DataFrame of TFN cells into an (n, n, 3) array.
+
+    Columns follow the index order and the diagonal is the unit self-weight
+    (1.0, 1.0, 1.0); diagonal cells are never parsed, as in `fuzzy_pipeline`.
+    """
+    names = list(W_df.index)
+    cells = W_df.loc[names, names].to_numpy(dtype=object, copy=True)
+    np.fill_diagonal(cells, 1.0)
+    return parse_interval_array(cells, labels=(names, names))
+
+
+@profiled("build_I")
+def state_vector_from_frame(I_df):
+    """Bulk-parse the first row of I into an (n, 3) array."""
+    return parse_interval_array(I_df.iloc[0].to_numpy(dtype=object), labels=(list(I_df.columns),))
+
+
+def load_weight_tensor(file, name=None):
+    """Read a W file and return (names, (n, n, 3) weight tensor)."""
+    W_df = read_table(file, name)
+    return list(W_df.index), weight_tensor_from_frame(W_df)
+
+
+def model_from_frames(W_df, I_df, metadata=None):
+    """Validate W/I DataFrames and parse them into a model dict.
+
+    The model holds `names`, the (n, n, 3) weight tensor `W`, the (n, 3)
+    initial state `I` and a `metadata` dict.
+    """
+    concepts = list(W_df.index)
+    if list(W_df.columns) != concepts:
+        raise ValueError('W rows and columns must have identical labels.')
+    if I_df.shape[1] == 1 and list(I_df.index) == concepts:
+        I_df = I_df.T
+    if list(I_df.columns) != concepts:
+        raise ValueError('I vector must have same concept names as W columns.')
+    return {
+        "names": concepts,
+        "W": weight_tensor_from_frame(W_df),
+        "I": state_vector_from_frame(I_df),
+        "metadata": dict(metadata or {}),
+    }
+
+
+@profiled("save_model")
+def save_model(file, names, W, I, metadata=None):
+    """Write a GFCM model as an uncompressed .npz archive.
+
+    Members are stored (not deflated), so `load_model` can memory-map the
+    weight tensor straight out of the file.
+    """
+    meta = {"format": MODEL_FORMAT, "version": MODEL_VERSION}
+    meta.update(metadata or {})
+    np.savez(file,
+             names=np.array([str(n) for n in names], dtype=str),
+             W=np.ascontiguousarray(W, dtype=float),
+             I=np.ascontiguousarray(I, dtype=float),
+             metadata=np.array(json.dumps(meta)))
+
+
+def _memmap_member(path, zf, member):
+    """Memory-map a stored .npy member of a zip archive, or None if compressed."""
+    info = zf.getinfo(member)
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+    with open(path, 'rb') as fh:
+        fh.seek(info.header_offset)
+        name_len, extra_len = struct.unpack('<HH', fh.read(30)[26:30])
+        fh.seek(info.header_offset + 30 + name_len + extra_len)
+        version = np.lib.format.read_magic(fh)
+        if version == (1, 0):
+            shape, fortran, dtype = np.lib.format.read_array_header_1_0(fh)
+        else:
+            shape, fortran, dtype = np.lib.format.read_array_header_2_0(fh)
+        offset = fh.tell()
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape,
+                     order='F' if fortran else 'C', offset=offset)
+
+
+@profiled("load_model")
+def load_model(file, mmap=True):
+    """Read a model written by `save_model`.
+
+    When `file` is a path and `mmap` is true, W is memory-mapped read-only
+    instead of copied into memory; file-like objects are read normally.
+    """
+    with np.load(file) as npz:
+        meta = json.loads(str(npz["metadata"]))
+        if meta.get("format") != MODEL_FORMAT:
+            raise ValueError("Not a GFCM model file.")
+        model = {"names": npz["names"].tolist(), "I": npz["I"], "metadata": meta}
+        W = None
+        if mmap and isinstance(file, (str, os.PathLike)):
+            with zipfile.ZipFile(file) as zf:
+                W = _memmap_member(file, zf, "W.npy")
+        model["W"] = npz["W"] if W is None else W
+    return model
+
+
+def weight_matrix_rows(n, edges, default=ZERO_TFN_CELL):
+    """Yield the n rows of W cells, one list at a time, from a {(i, j): cell} dict."""
+    by_row = {}
+    for (i, j), cell in edges.items():
+        by_row.setdefault(i, []).append((j, cell))
+    for i in range(n):
+        row = [default] * n
+        for j, cell in by_row.get(i, ()):
+            row[j] = cell
+        yield row
+
+
+@contextmanager
+def _text_output(file):
+    # Paths are opened here; binary file objects are wrapped and left open
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "w", newline="", encoding="utf-8") as fh:
+            yield fh
+    else:
+        fh = io.TextIOWrapper(file, encoding="utf-8", newline="")
+        try:
+            yield fh
+        finally:
+            fh.flush()
+            fh.detach()
+
+
+@profiled("export")
+def write_weight_matrix(file, names, rows, fmt="csv", chunk_rows=EXPORT_CHUNK_ROWS, progress=None):
+    """Write W row by row as CSV or as a write-only 'Matrix_W' XLSX sheet.
+
+    `rows` yields one list of n cells per concept (see `weight_matrix_rows`),
+    so only `chunk_rows` rows are held at a time, whatever the size of the
+    map. `file` is a path or a binary file object. The output has the layout
+    of the builder's matrix export and reads back with `read_table`.
+    `progress(rows_written)` is called after every chunk.
+    """
+    names = [str(n) for n in names]
+    rows = iter(rows)
+    if fmt == "csv":
+        with _text_output(file) as fh:
+            writer = csv.writer(fh, lineterminator="\n")
+            writer.writerow([""] + names)
+            done = 0
+            while True:
+                chunk = list(itertools.islice(rows, chunk_rows))
+                if not chunk:
+                    break
+                writer.writerows([names[done + k]] + row for k, row in enumerate(chunk))
+                done += len(chunk)
+                if progress:
+                    progress(done)
+        return
+    if len(names) + 1 > XLSX_MAX_COLUMNS:
+        raise ValueError(f"{len(names)} concepts do not fit in an XLSX sheet; export CSV or an edge list.")
+    from openpyxl import Workbook
+
+    # Write-only sheets stream rows to a temporary file instead of keeping cells
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Matrix_W")
+    ws.append([None] + names)
+    for k, (name, row) in enumerate(zip(names, rows), 1):
+        ws.append([name] + row)
+        if progress and (k % chunk_rows == 0 or k == len(names)):
+            progress(k)
+    wb.save(file)
+
+
+@profiled("export")
+def write_edge_list(file, names, rows, cols, values):
+    """Write edges as CSV rows of (source, target, lo, mid, hi), in memory O(edges).
+
+    Reads back with `fuzzy_sparse.read_edge_list`.
+    """
+    values = np.asarray(values, dtype=float).reshape(-1, 3)
+    df = pd.DataFrame({"source": np.asarray(names, dtype=object)[np.asarray(rows, dtype=np.int64)],
+                       "target": np.asarray(names, dtype=object)[np.asarray(cols, dtype=np.int64)],
+                       "lo": values[:, 0], "mid": values[:, 1], "hi": values[:, 2]})
+    with _text_output(file) as fh:
+        df.to_csv(fh, index=False, lineterminator="\n")
+
+
+def content_hash(*parts):
+    """SHA-256 hex digest over a sequence of byte strings."""
+    h = hashlib.sha256()
+    for part in parts:
+        part = part or b""
+        h.update(len(part).to_bytes(8, 'little'))
+        h.update(part)
+    return h.hexdigest()
+
+
+@profiled("upload")
+def load_model_bytes(W_bytes, W_name, I_bytes=None, I_name=None, cache=None):
+    """Parse uploaded W/I files, or a single .npz model, into a model dict.
+
+    Results are stored in `cache` (any dict, e.g. per-session state) under
+    the content hash of the uploads, so unchanged files are parsed once. The
+    cache keeps the `MODEL_CACHE_SIZE` most recent models.
+    """
+    key = content_hash(W_name.encode(), W_bytes, (I_name or "").encode(), I_bytes)
+    if cache is not None and key in cache:
+        return cache[key]
+    if W_name.endswith('.npz'):
+        model = load_model(BytesIO(W_bytes))
+    else:
+        model = model_from_frames(read_table(BytesIO(W_bytes), W_name),
+                                  read_table(BytesIO(I_bytes), I_name))
+    model["hash"] = key
+    if cache is not None:
+        cache[key] = model
+        while len(cache) > MODEL_CACHE_SIZE:
+            del cache[next(iter(cache))]
+    return model
@@ -0,0 +1,170 @@
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import fuzzy_profile
+from fuzzy_engine import defuzzify_array, simulate_history, simulate_until_stable
+
+JOB_STATES = ("queued", "running", "done", "cancelled", "failed")
+# Finished jobs (and their results) are dropped this many seconds after they end...
+FINISHED_TTL = 600
+# ...and beyond this many, oldest first, whether or not anyone collected them
+MAX_FINISHED = 32
+
+
+class JobCancelled(Exception):
+    """Raised inside a running simulation to stop it at the next step."""
+
+
+class SimulationJob:
+    """Handle to a simulation submitted to a `JobQueue`.
+
+    Exposes the job's `status`, per-iteration `progress`, the partial
+    centroid trajectory while running, and the `result` tuple
+    (fuzzy_hist, crisp_hist, conv_info) once done.
+    """
+
+    def __init__(self, job_id, params, n, iterations):
+        self.id = job_id
+        self.params = params
+        self.iterations = iterations
+        self.status = "queued"
+        self.steps_done = -1
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.finished = None
+        self._crisp = np.full((iterations + 1, n), np.nan)
+        self._cancel = threading.Event()
+        self._future = None
+        # Profiling session of the submitting thread, re-attached on the worker thread
+        self._profile = fuzzy_profile.attached()
+
+    @property
+    def progress(self):
+        """Fraction of the iteration budget computed so far."""
+        if self.status == "done":
+            return 1.0
+        return max(0, self.steps_done) / max(1, self.iterations)
+
+    @property
+    def done(self):
+        return self.status in ("done", "cancelled", "failed")
+
+    def cancel(self):
+        """Request cancellation; a queued job never starts, a running one stops at its next step."""
+        self._cancel.set()
+        if self._future is not None and self._future.cancel():
+            self.status = "cancelled"
+            self.finished = time.time()
+
+    def partial_centroids(self):
+        """Centroid trajectory computed so far, shape (steps_done+1, n)."""
+        return self._crisp[:self.steps_done + 1].copy()
+
+    def _on_step(self, t, X):
+        if self._cancel.is_set():
+            raise JobCancelled()
+        self._crisp[t] = defuzzify_array(X)
+        self.steps_done = t
+
+    def _run(self, W, X0, clamp, lam, stop_early, tol):
+        if self._cancel.is_set():
+            self.status = "cancelled"
+            self.finished = time.time()
+            return
+        self.status = "running"
+        fuzzy_profile.attach(self._profile)
+        try:
+            if stop_early:
+                result = simulate_until_stable(W, X0, clamp, lam, self.iterations, tol,
+                                               callback=self._on_step)
+            else:
+                _, fuzzy_hist, crisp_hist = simulate_history(W, X0, clamp, lam, self.iterations,
+                                                             callback=self._on_step)
+                result = (fuzzy_hist, crisp_hist, None)
+            self.result = result
+            self.status = "done"
+        except JobCancelled:
+            self.status = "cancelled"
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            self.status = "failed"
+        finally:
+            fuzzy_profile.attach(None)
+            self.finished = time.time()
+
+
+class JobQueue:
+    """Runs simulations on a pool of background threads.
+
+    NumPy and the compiled kernel (`fuzzy_kernels`) release the GIL inside
+    the heavy array work, so several jobs make progress at once while the
+    caller (e.g. a Streamlit script) stays responsive. Jobs beyond
+    `max_workers` wait in FIFO order. Finished jobs are kept for
+    `finished_ttl` seconds and at most `max_finished` of them, so results
+    nobody collects do not pile up.
+    """
+
+    def __init__(self, max_workers=2, finished_ttl=FINISHED_TTL, max_finished=MAX_FINISHED):
+        self._pool = ThreadPoolExecutor(max_workers, thread_name_prefix="gfcm-job")
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.finished_ttl = finished_ttl
+        self.max_finished = max_finished
+
+    def _prune(self):
+        # Called with the lock held
+        finished = sorted((j for j in self._jobs.values() if j.done and j.finished is not None),
+                          key=lambda j: j.finished)
+        expired = time.time() - self.finished_ttl
+        excess = len(finished) - self.max_finished
+        for k, job in enumerate(finished):
+            if k < excess or job.finished < expired:
+                del self._jobs[job.id]
+
+    def submit(self, W, X0, clamp=None, lam=1.0, iterations=15, stop_early=False, tol=1e-6,
+               **params):
+        """Queue a simulation and return its SimulationJob handle.
+
+        Extra keyword arguments are stored on the handle as `params` for the
+        caller's bookkeeping (labels, cache keys, ...).
+        """
+        with self._lock:
+            job_id = next(self._ids)
+        params = dict(params, lam=lam, iterations=iterations, stop_early=stop_early, tol=tol)
+        job = SimulationJob(job_id, params, np.asarray(X0).shape[0], iterations)
+        with self._lock:
+            self._prune()
+            self._jobs[job_id] = job
+        job._future = self._pool.submit(job._run, W, X0, clamp, lam, stop_early, tol)
+        return job
+
+    def get(self, job_id):
+        """The job's handle, or None once it has been forgotten or expired."""
+        with self._lock:
+            self._prune()
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        """All jobs in submission order."""
+        with self._lock:
+            self._prune()
+            return list(self._jobs.values())
+
+    def forget(self, job_id):
+        """Drop a finished job's handle (and its results) from the queue."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.done:
+                del self._jobs[job_id]
+
+    def shutdown(self, cancel=True):
+        if cancel:
+            for job in self.jobs():
+                job.cancel()
+        self._pool.shutdown(wait=True)
@@ -0,0 +1,95 @@
+"""Compiled fused fuzzy multiply-accumulate kernel.
+
+For every row i the kernel walks j once, forms the 9 endpoint products of
+W[i, j] ⊗ X[j] in registers, takes their min, median (a 19-comparison
+selection network) and max, and adds them straight into the row's running
+sums. No (rows, n, 9) product buffer is allocated and nothing is sorted.
+Columns whose weight is exactly zero add exact zeros and are skipped.
+Accumulation runs over j in order in float64, so float64 inputs give results
+bit-identical to `fuzzy_pipeline.fuzzy_pipeline`. float32 inputs halve the
+memory traffic of W and X and differ only by the rounding of the products.
+The kernel runs on the calling thread and releases the GIL while it runs
+(it touches no Python objects), so job-queue threads and the Streamlit
+script thread keep going alongside it; sweeps and batch runs parallelise
+across processes above it.
+
+Needs numba. Without it HAVE_NUMBA is False and `fuzzy_engine` keeps using
+its row-blocked NumPy kernel.
+"""
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+HAVE_NUMBA = numba is not None
+# Set to False to force the NumPy kernel even when numba is installed
+USE_COMPILED = True
+
+
+if HAVE_NUMBA:
+    @numba.njit(inline="always")
+    def _sort2(a, b):
+        return (a, b) if a <= b else (b, a)
+
+    @numba.njit(inline="always")
+    def _median9(p0, p1, p2, p3, p4, p5, p6, p7, p8):
+        # Selection network for the 5th smallest of 9 (Paeth / Devillard)
+        p1, p2 = _sort2(p1, p2)
+        p4, p5 = _sort2(p4, p5)
+        p7, p8 = _sort2(p7, p8)
+        p0, p1 = _sort2(p0, p1)
+        p3, p4 = _sort2(p3, p4)
+        p6, p7 = _sort2(p6, p7)
+        p1, p2 = _sort2(p1, p2)
+        p4, p5 = _sort2(p4, p5)
+        p7, p8 = _sort2(p7, p8)
+        p0, p3 = _sort2(p0, p3)
+        p5, p8 = _sort2(p5, p8)
+        p4, p7 = _sort2(p4, p7)
+        p3, p6 = _sort2(p3, p6)
+        p1, p4 = _sort2(p1, p4)
+        p2, p5 = _sort2(p2, p5)
+        p4, p7 = _sort2(p4, p7)
+        p4, p2 = _sort2(p4, p2)
+        p6, p4 = _sort2(p6, p4)
+        p4, p2 = _sort2(p4, p2)
+        return p4
+
+    @numba.njit(cache=True, nogil=True)
+    def _fused_kernel(W, X, S):
+        rows, n = W.shape[0], W.shape[1]
+        B = X.shape[0]
+        for i in range(rows):
+            acc = np.zeros((B, 3))
+            for j in range(n):
+                a0, a1, a2 = W[i, j, 0], W[i, j, 1], W[i, j, 2]
+                if a0 == 0 and a1 == 0 and a2 == 0:
+                    continue
+                for b in range(B):
+                    x0, x1, x2 = X[b, j, 0], X[b, j, 1], X[b, j, 2]
+                    p0, p1, p2 = a0 * x0, a0 * x1, a0 * x2
+                    p3, p4, p5 = a1 * x0, a1 * x1, a1 * x2
+                    p6, p7, p8 = a2 * x0, a2 * x1, a2 * x2
+                    acc[b, 0] += min(p0, p1, p2, p3, p4, p5, p6, p7, p8)
+                    acc[b, 1] += _median9(p0, p1, p2, p3, p4, p5, p6, p7, p8)
+                    acc[b, 2] += max(p0, p1, p2, p3, p4, p5, p6, p7, p8)
+            for b in range(B):
+                S[b, i, 0] = acc[b, 0]
+                S[b, i, 1] = acc[b, 1]
+                S[b, i, 2] = acc[b, 2]
+
+
+def compiled_available():
+    return HAVE_NUMBA and USE_COMPILED
+
+
+def fused_multiply_sum(W, X):
+    """Row sums of W[i, j] ⊗ X[j] for dense (m, n, 3) W and (..., n, 3) X, in one pass."""
+    batch = X.shape[:-2]
+    Xb = np.ascontiguousarray(X.reshape((-1,) + X.shape[-2:]))
+    # One output row per row of W, which may be a subset of the rows (m < n)
+    S = np.empty((len(Xb), W.shape[0], 3), dtype=np.result_type(W.dtype, X.dtype))
+    _fused_kernel(W, Xb, S)
+    return S.reshape(batch + (W.shape[0], 3))
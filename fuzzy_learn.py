@@ -0,0 +1,257 @@
+"""Fit GFCM weights to observed concept trajectories.
+
+    python fuzzy_learn.py series.csv --out W_fitted.xlsx --structure W.csv
+
+The series table has one row per time step and one column per concept
+(crisp activations; blank cells are missing observations). With
+`--structure`, only the edges present in that W file are learned and its
+values are the starting point.
+"""
+import argparse
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from fuzzy_engine import ROW_BLOCK_ELEMENTS, defuzzify_array, fuzzy_multiply_array
+from fuzzy_kernels import compiled_available, fused_multiply_sum
+
+# Upper bound on elements in the candidate weight tensors scored at once
+POPULATION_BLOCK_ELEMENTS = 8_000_000
+# Per-worker copies of the training data, set once by the pool initializer
+_WORKER = {}
+
+
+def project_tfns(P, bounds=(-1.0, 1.0)):
+    """Clip TFN parameters to `bounds` and order each triple so lo ≤ mid ≤ hi."""
+    return np.sort(np.clip(P, *bounds), axis=-1)
+
+
+def _as_training_data(targets, X0=None):
+    """(S, T+1, n) observed centroids and (S, n, 3) initial states."""
+    targets = np.asarray(targets, dtype=float)
+    if targets.ndim == 2:
+        targets = targets[None]
+    if X0 is None:
+        # Crisp observations as degenerate TFNs (x, x, x)
+        X0 = np.repeat(targets[:, 0, :, None], 3, axis=-1)
+    X0 = np.broadcast_to(np.asarray(X0, dtype=float), targets.shape[:1] + targets.shape[2:] + (3,))
+    if np.isnan(X0).any():
+        raise ValueError("Initial states must be fully observed.")
+    return targets, X0
+
+
+def weights_from_params(params, mask, base=None):
+    """Scatter (..., k, 3) edge parameters into (..., n, n, 3) weight tensors.
+
+    Entries outside `mask` come from `base` (zero by default) and the
+    diagonal is the unit self-weight.
+    """
+    n = mask.shape[0]
+    W = np.zeros(params.shape[:-2] + (n, n, 3))
+    if base is not None:
+        W[...] = base
+    W[..., mask, :] = params
+    idx = np.arange(n)
+    W[..., idx, idx, :] = 1.0
+    return W
+
+
+def population_multiply_sum(W, X):
+    """Row sums Σ_j W[p, i, j] ⊗ X[p, s, j] for (P, n, n, 3) W and (P, S, n, 3) X."""
+    if compiled_available():
+        return np.stack([fused_multiply_sum(Wp, Xp) for Wp, Xp in zip(W, X)])
+    P, S, n = X.shape[:3]
+    out = np.empty(X.shape)
+    step = max(1, ROW_BLOCK_ELEMENTS // (9 * n * n * S))
+    for a in range(0, P, step):
+        prods = fuzzy_multiply_array(W[a:a + step, None], X[a:a + step, :, None])
+        out[a:a + step] = prods.sum(axis=-2, dtype=np.float64)
+    return out
+
+
+def trajectory_loss(W, X0, targets, clamp=None, lam=1.0):
+    """Mean squared error between simulated and observed centroids.
+
+    W is one (n, n, 3) tensor or a (P, n, n, 3) population, simulated
+    together; X0 is a (S, n, 3) stack of initial states and targets the
+    (S, T+1, n) observed centroids. NaN observations are ignored and step 0
+    is not scored. Returns a float, or a (P,) array for a population.
+    """
+    single = W.ndim == 3
+    W = W[None] if single else W
+    X0 = np.broadcast_to(X0, (len(W),) + X0.shape)
+    X = X0
+    err = np.zeros(len(W))
+    observed = ~np.isnan(targets[:, 1:])
+    for t in range(1, targets.shape[1]):
+        X = np.tanh(lam * population_multiply_sum(W, X))
+        if clamp is not None and np.any(clamp):
+            X = np.where(clamp[..., None], X0, X)
+        diff = defuzzify_array(X) - targets[:, t]
+        err += np.nansum(diff ** 2, axis=(1, 2))
+    err /= max(int(observed.sum()), 1)
+    return float(err[0]) if single else err
+
+
+def population_loss(params, mask, X0, targets, clamp=None, lam=1.0, base=None):
+    """`trajectory_loss` of every candidate in a (P, k, 3) population, scored in blocks."""
+    n = mask.shape[0]
+    step = max(1, POPULATION_BLOCK_ELEMENTS // (3 * n * n))
+    return np.concatenate([
+        trajectory_loss(weights_from_params(params[a:a + step], mask, base), X0, targets, clamp, lam)
+        for a in range(0, len(params), step)])
+
+
+def _init_worker(mask, X0, targets, clamp, lam, base):
+    _WORKER.update(mask=mask, X0=X0, targets=targets, clamp=clamp, lam=lam, base=base)
+
+
+def _run_chunk(params):
+    w = _WORKER
+    return population_loss(params, w["mask"], w["X0"], w["targets"], w["clamp"], w["lam"], w["base"])
+
+
+def learn_weights(targets, X0=None, mask=None, W_init=None, clamp=None, lam=1.0, population=40,
+                  generations=200, F=0.6, CR=0.9, init_spread=0.1, bounds=(-1.0, 1.0), tol=1e-10,
+                  seed=None, processes=None, callback=None):
+    """Fit the TFN weights of W to observed centroid trajectories.
+
+    `targets` is a (T+1, n) series, or (S, T+1, n) for several runs, with NaN
+    for missing observations. `X0` gives the fuzzy initial states, defaulting
+    to the crisp first observation. Only edges in the (n, n) boolean `mask`
+    are learned (every off-diagonal edge by default); other entries stay at
+    `W_init`, or zero.
+
+    Uses differential evolution (DE/rand/1/bin) over whole populations. Every
+    generation, all trial tensors are projected onto lo ≤ mid ≤ hi within
+    `bounds` and scored together, in chunks spread across a process pool of
+    `processes` workers (all local cores by default). The search stops after
+    `generations` or once the best loss is at most `tol`.
+    `callback(generation, best_loss)` is called after every generation.
+
+    Returns a dict with the fitted `W`, its `loss` and the best loss per
+    generation in `history`.
+    """
+    targets, X0 = _as_training_data(targets, X0)
+    n = targets.shape[2]
+    if mask is None:
+        mask = ~np.eye(n, dtype=bool)
+    mask = np.asarray(mask, dtype=bool) & ~np.eye(n, dtype=bool)
+    clamp = None if clamp is None else np.broadcast_to(np.asarray(clamp, dtype=bool), X0.shape[:2])
+    base = None if W_init is None else np.asarray(W_init, dtype=float)
+    k = int(mask.sum())
+    if population < 4:
+        # DE/rand/1 draws three partners distinct from each member
+        raise ValueError(f"Differential evolution needs a population of at least 4, got {population}.")
+    if k == 0:
+        raise ValueError("The structure mask selects no off-diagonal edges; there is nothing to learn.")
+    rng = np.random.default_rng(seed)
+
+    # Start around W_init (or zero) with mid jitter and a small spread
+    start = np.zeros((k, 3)) if base is None else base[mask]
+    pop = start + rng.uniform(-1, 1, (population, k, 1)) * (bounds[1] - bounds[0]) / 4
+    pop = pop + np.array([-1.0, 0.0, 1.0]) * rng.uniform(0, init_spread, (population, k, 1))
+    pop[0] = start
+    pop = project_tfns(pop, bounds)
+
+    processes = processes or os.cpu_count() or 1
+    chunksize = max(1, math.ceil(population / processes))
+    pool = None
+    if processes > 1 and population > 1:
+        pool = ProcessPoolExecutor(processes, initializer=_init_worker,
+                                   initargs=(mask, X0, targets, clamp, lam, base))
+
+    def evaluate(params):
+        if pool is None:
+            return population_loss(params, mask, X0, targets, clamp, lam, base)
+        chunks = [params[i:i + chunksize] for i in range(0, len(params), chunksize)]
+        return np.concatenate(list(pool.map(_run_chunk, chunks)))
+
+    try:
+        loss = evaluate(pop)
+        history = [float(loss.min())]
+        for gen in range(generations):
+            if history[-1] <= tol:
+                break
+            # Three distinct partners per member, all different from the member itself
+            r = np.argsort(rng.random((population, population)) + np.eye(population), axis=1)[:, :3]
+            mutant = pop[r[:, 0]] + F * (pop[r[:, 1]] - pop[r[:, 2]])
+            cross = rng.random((population, k, 1)) < CR
+            cross[np.arange(population), rng.integers(0, k, population)] = True
+            trial = project_tfns(np.where(cross, mutant, pop), bounds)
+            trial_loss = evaluate(trial)
+            better = trial_loss <= loss
+            pop[better], loss[better] = trial[better], trial_loss[better]
+            history.append(float(loss.min()))
+            if callback:
+                callback(gen + 1, history[-1])
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    best = int(np.argmin(loss))
+    return {"W": weights_from_params(pop[best], mask, base), "loss": float(loss[best]),
+            "history": np.array(history)}
+
+
+def weight_frame(names, W, precision=4):
+    """W as the builder's n×n table of "[lo,mid,hi]" cells."""
+    cells = [[f"[{lo:.{precision}f},{mid:.{precision}f},{hi:.{precision}f}]" for lo, mid, hi in row]
+             for row in np.asarray(W).tolist()]
+    df = pd.DataFrame(cells, index=list(names), columns=list(names))
+    df.index.name = ""
+    return df
+
+
+def export_weights(file, names, W, precision=4):
+    """Write W as CSV or as a 'Matrix_W' XLSX sheet, readable by `fuzzy_io.read_table`."""
+    df = weight_frame(names, W, precision)
+    name = str(getattr(file, "name", file))
+    if name.endswith(".csv"):
+        df.to_csv(file)
+    else:
+        with pd.ExcelWriter(file, engine="openpyxl") as w:
+            df.to_excel(w, sheet_name="Matrix_W")
+
+
+def main(argv=None):
+    from fuzzy_io import load_weight_tensor, read_table
+
+    parser = argparse.ArgumentParser(description="Fit GFCM weights to an observed time series.")
+    parser.add_argument("series", help="CSV/XLSX table: rows are time steps, columns are concepts")
+    parser.add_argument("--out", required=True, help="fitted W as .csv or .xlsx")
+    parser.add_argument("--structure", help="W file whose non-zero edges are learned (default: all)")
+    parser.add_argument("--lam", type=float, default=1.0, help="tanh steepness λ")
+    parser.add_argument("--population", type=int, default=40)
+    parser.add_argument("--generations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--processes", type=int, default=None, help="worker processes (default: all cores)")
+    args = parser.parse_args(argv)
+
+    series = read_table(args.series)
+    names = [str(c) for c in series.columns]
+    mask = W_init = None
+    if args.structure:
+        W_names, W_init = load_weight_tensor(args.structure)
+        if [str(c) for c in W_names] != names:
+            raise SystemExit("Structure W must have the same concepts, in the same order, as the series.")
+        mask = np.any(W_init != 0, axis=2)
+
+    def progress(gen, loss):
+        if gen % 10 == 0:
+            print(f"generation {gen}: best MSE {loss:.6g}", file=sys.stderr)
+
+    result = learn_weights(series.to_numpy(dtype=float), mask=mask, W_init=W_init, lam=args.lam,
+                           population=args.population, generations=args.generations,
+                           seed=args.seed, processes=args.processes, callback=progress)
+    export_weights(args.out, names, result["W"])
+    print(f"Fitted W written to {args.out} (MSE {result['loss']:.6g}).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
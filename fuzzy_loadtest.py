@@ -0,0 +1,154 @@
+"""Load test of the local GFCM service: throughput and latency percentiles.
+
+    python fuzzy_loadtest.py --n 200 --scenarios 16 --requests 400 --concurrency 8
+    python fuzzy_loadtest.py --url http://127.0.0.1:8765 --n 500 --format json
+
+Without --url a service is started in this process on a free loopback port
+with --workers pool processes. A seeded synthetic model
+(`fuzzy_benchmark.synthetic_model`) is registered, then --concurrency client
+threads, each over its own kept-alive connection, send --requests simulate
+requests in total. Each request carries --scenarios scenarios with random λ,
+one clamped concept and one overridden input.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+import numpy as np
+
+from fuzzy_benchmark import synthetic_model
+from fuzzy_service import Client, SimulationService, make_server, require_loopback
+from fuzzy_sparse import sparse_to_dense
+
+# Requests per client thread sent before timing starts (pool start-up, JIT, model mapping)
+WARMUP_REQUESTS = 2
+
+
+def scenario_batches(names, count, scenarios, seed=0):
+    """`count` request payloads of `scenarios` random scenarios each."""
+    rng = np.random.default_rng(seed)
+    batches = []
+    for _ in range(count):
+        batch = []
+        for _ in range(scenarios):
+            clamp, override = rng.choice(len(names), 2, replace=False)
+            lo, hi = np.sort(rng.uniform(-1, 1, 2))
+            batch.append({"lam": round(float(rng.uniform(0.5, 2.0)), 3), "clamp": [names[clamp]],
+                          "inputs": {names[override]: [lo, (lo + hi) / 2, hi]}})
+        batches.append(batch)
+    return batches
+
+
+def run_load(host, port, model_id, batches, concurrency, options):
+    """Send every batch over `concurrency` connections; returns latencies (s), wall time and errors."""
+    latencies, errors = [], []
+    lock = threading.Lock()
+    work = iter(batches)
+
+    def client_loop():
+        client = Client(host, port)
+        try:
+            while True:
+                with lock:
+                    batch = next(work, None)
+                if batch is None:
+                    return
+                start = time.perf_counter()
+                try:
+                    client.simulate(model_id, batch, **options)
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        latencies.append(elapsed)
+                except Exception as e:
+                    with lock:
+                        errors.append(f"{type(e).__name__}: {e}")
+                    client.close()
+                    client = Client(host, port)
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=client_loop) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return np.array(latencies), time.perf_counter() - start, errors
+
+
+def summarise(latencies, wall, errors, scenarios):
+    done = len(latencies)
+    ms = latencies * 1e3 if done else np.zeros(1)
+    return {
+        "requests": done, "errors": len(errors), "seconds": wall,
+        "requests_per_s": done / wall, "scenarios_per_s": done * scenarios / wall,
+        "p50_ms": float(np.percentile(ms, 50)), "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)), "max_ms": float(ms.max()),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the local GFCM service.")
+    parser.add_argument("--url", default=None, help="running service (default: start one in-process)")
+    parser.add_argument("--workers", type=int, default=None, help="pool size of an in-process service")
+    parser.add_argument("--n", type=int, default=200, help="concepts in the synthetic model")
+    parser.add_argument("--density", type=float, default=0.1)
+    parser.add_argument("--scenarios", type=int, default=16, help="scenarios per request")
+    parser.add_argument("--iterations", type=int, default=15)
+    parser.add_argument("--history", default="full")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--format", choices=("npz", "json"), default="npz")
+    parser.add_argument("--dtype", choices=("float64", "float32"), default="float64")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="write the summary as JSON")
+    args = parser.parse_args(argv)
+
+    server = service = None
+    if args.url:
+        url = urlparse(args.url)
+        host, port = url.hostname, url.port or 80
+        require_loopback(host)
+    else:
+        service = SimulationService(workers=args.workers)
+        server = make_server("127.0.0.1", 0, service, quiet=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = "127.0.0.1", server.server_port
+
+    try:
+        names, Ws, X0 = synthetic_model(args.n, args.density, seed=args.seed)
+        client = Client(host, port)
+        model_id = client.upload_model(names, sparse_to_dense(Ws), X0, {"source": "fuzzy_loadtest"})
+        client.close()
+        options = {"iterations": args.iterations, "history": args.history,
+                   "format": args.format, "dtype": args.dtype}
+        warmup = scenario_batches(names, WARMUP_REQUESTS * args.concurrency, args.scenarios, args.seed + 1)
+        run_load(host, port, model_id, warmup, args.concurrency, options)
+        batches = scenario_batches(names, args.requests, args.scenarios, args.seed)
+        latencies, wall, errors = run_load(host, port, model_id, batches, args.concurrency, options)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+            service.close()
+
+    summary = summarise(latencies, wall, errors, args.scenarios)
+    summary.update(n=args.n, scenarios=args.scenarios, iterations=args.iterations,
+                   concurrency=args.concurrency, format=args.format, dtype=args.dtype)
+    print(f"{summary['requests']} requests ({summary['errors']} errors) in {wall:.2f}s: "
+          f"{summary['requests_per_s']:.1f} req/s, {summary['scenarios_per_s']:.0f} scenarios/s")
+    print(f"latency p50 {summary['p50_ms']:.1f} ms, p90 {summary['p90_ms']:.1f} ms, "
+          f"p99 {summary['p99_ms']:.1f} ms, max {summary['max_ms']:.1f} ms")
+    for e in errors[:5]:
+        print(f"  error: {e}", file=sys.stderr)
+    if args.out:
+        with open(args.out, "w") as fh:
+            json.dump(summary, fh, indent=2)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
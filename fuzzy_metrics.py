@@ -0,0 +1,164 @@
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from fuzzy_profile import profiled
+
+# Edge weights usable for shortest paths: None counts hops, otherwise the
+# distance of an edge is 1/|w| for that TFN component (or its centroid)
+WEIGHT_MODES = (None, "lo", "mid", "hi", "centroid")
+# Smaller maps are computed in-process; a pool costs more than it saves
+PARALLEL_MIN_NODES = 500
+# Per-worker copy of the path graph, set once by the pool initializer
+_WORKER = {}
+
+
+def edge_arrays(W):
+    """Drawn edges of a dense or sparse W as (rows, cols, (m, 3) TFN values).
+
+    The unit self-weight on the diagonal is not an edge.
+    """
+    if hasattr(W, "indptr"):
+        rows = np.repeat(np.arange(len(W.indptr) - 1), np.diff(W.indptr))
+        cols, vals = W.indices, W.values
+        keep = rows != cols
+        return rows[keep], cols[keep], vals[keep]
+    W = np.asarray(W, dtype=float)
+    mask = np.any(W != 0, axis=2)
+    np.fill_diagonal(mask, False)
+    rows, cols = np.nonzero(mask)
+    return rows, cols, W[rows, cols]
+
+
+def edge_distances(vals, weight=None):
+    """Shortest-path length of each edge; NaN where the chosen weight is zero."""
+    if weight not in WEIGHT_MODES:
+        raise ValueError(f"Unknown edge weight {weight!r}; expected one of {WEIGHT_MODES}.")
+    if weight is None:
+        return np.ones(len(vals))
+    w = vals.mean(axis=1) if weight == "centroid" else vals[:, ("lo", "mid", "hi").index(weight)]
+    with np.errstate(divide="ignore"):
+        return np.where(w != 0, 1.0 / np.abs(w), np.nan)
+
+
+def path_graph(n, rows, cols, dist):
+    """networkx DiGraph on nodes 0..n-1 with a 'distance' attribute per edge."""
+    import networkx as nx
+    G = nx.DiGraph()
+    G.add_nodes_from(range(n))
+    keep = ~np.isnan(dist)
+    G.add_weighted_edges_from(zip(rows[keep].tolist(), cols[keep].tolist(), dist[keep].tolist()),
+                              weight="distance")
+    return G
+
+
+def betweenness_sample_size(n, epsilon=None, delta=0.1):
+    """Pivot sources needed for betweenness within ±epsilon with probability 1-delta.
+
+    Hoeffding bound with a union bound over the n concepts (Brandes & Pich);
+    `epsilon=None` or a budget needing every node means the exact value.
+    """
+    if not epsilon or n < 3:
+        return n
+    return min(n, math.ceil(math.log(2 * n / delta) / (2 * epsilon ** 2)))
+
+
+def _betweenness_chunk(G, weight, sources):
+    import networkx as nx
+    raw = nx.betweenness_centrality_subset(G, sources, list(G), normalized=False, weight=weight)
+    return np.fromiter((raw[v] for v in range(len(raw))), dtype=float, count=len(raw))
+
+
+def _closeness_chunk(G, weight, sources):
+    import networkx as nx
+    n = G.number_of_nodes()
+    dist_sum, reach = np.zeros(n), np.zeros(n)
+    for s in sources:
+        if weight is None:
+            lengths = nx.single_source_shortest_path_length(G, s)
+        else:
+            lengths = nx.single_source_dijkstra_path_length(G, s, weight=weight)
+        lengths.pop(s)
+        idx = np.fromiter(lengths.keys(), dtype=np.intp, count=len(lengths))
+        dist_sum[idx] += np.fromiter(lengths.values(), dtype=float, count=len(lengths))
+        reach[idx] += 1
+    return dist_sum, reach
+
+
+def _init_worker(G, weight):
+    _WORKER.update(G=G, weight=weight)
+
+
+_CHUNK_RUNNERS = {"betweenness": _betweenness_chunk, "closeness": _closeness_chunk}
+
+
+def _run_task(task):
+    kind, sources = task
+    return kind, _CHUNK_RUNNERS[kind](_WORKER["G"], _WORKER["weight"], sources)
+
+
+@profiled("graph_metrics")
+def graph_metrics(W, names=None, weight=None, epsilon=None, delta=0.1, seed=None,
+                  processes=None, chunksize=None):
+    """Centrality table of a dense or sparse W, one row per concept.
+
+    Degrees come straight from the edge arrays. Betweenness and closeness
+    (networkx conventions: normalised, directed, closeness over incoming
+    distances) are exact by default; with an error budget `epsilon` they are
+    estimated from a random sample of pivot sources sized by
+    `betweenness_sample_size`. On maps of PARALLEL_MIN_NODES or more, sources
+    are split into chunks that run across a spawned process pool of
+    `processes` workers (all local cores by default).
+    `weight` picks the TFN component used for path lengths (see WEIGHT_MODES).
+    """
+    rows, cols, vals = edge_arrays(W)
+    n = len(W.indptr) - 1 if hasattr(W, "indptr") else len(W)
+    names = list(range(n)) if names is None else list(names)
+
+    in_deg = np.bincount(cols, minlength=n)
+    out_deg = np.bincount(rows, minlength=n)
+    k = betweenness_sample_size(n, epsilon, delta)
+    sources = np.arange(n) if k == n else np.random.default_rng(seed).choice(n, k, replace=False)
+    sources = sources.tolist()
+
+    G = path_graph(n, rows, cols, edge_distances(vals, weight))
+    attr = None if weight is None else "distance"
+    processes = processes or os.cpu_count() or 1
+    chunksize = chunksize or max(1, math.ceil(k / (4 * processes)))
+    chunks = [sources[i:i + chunksize] for i in range(0, k, chunksize)]
+    tasks = [(kind, c) for c in chunks for kind in ("betweenness", "closeness")]
+    if processes == 1 or len(chunks) == 1 or n < PARALLEL_MIN_NODES:
+        results = [(kind, _CHUNK_RUNNERS[kind](G, attr, c)) for kind, c in tasks]
+    else:
+        # Spawned workers: forking the threaded Streamlit server is unsafe
+        with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(G, attr)) as pool:
+            results = list(pool.map(_run_task, tasks))
+
+    between, dist_sum, reach = np.zeros(n), np.zeros(n), np.zeros(n)
+    for kind, res in results:
+        if kind == "betweenness":
+            between += res
+        else:
+            dist_sum += res[0]
+            reach += res[1]
+    if n > 2:
+        between *= n / k / ((n - 1) * (n - 2))
+    # Sampled sources other than each node itself; n-1 for the exact value
+    others = k - np.isin(np.arange(n), sources)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        closeness = np.where(dist_sum > 0, reach / dist_sum * reach / np.maximum(others, 1), 0.0)
+
+    df = pd.DataFrame({
+        "Degree Centrality": (in_deg + out_deg) / max(n - 1, 1),
+        "In-Degree": in_deg,
+        "Out-Degree": out_deg,
+        "Betweenness": between,
+        "Closeness": closeness,
+    }, index=pd.Index(names, name="Concept"))
+    df.attrs.update(sources=k, exact=k == n, weight=weight)
+    return df
@@ -0,0 +1,153 @@
+import numpy as np
+
+from fuzzy_engine import defuzzify_array
+
+# Upper bound on elements in one batch of sampled (B, n, n) crisp weight matrices
+BATCH_ELEMENTS = 8_000_000
+
+
+def sample_crisp_weights(W, size, rng=None):
+    """Draw `size` crisp weight matrices from the triangular distributions of W.
+
+    Each cell (lo, mid, hi) is sampled by inverse CDF; degenerate triangles
+    (lo == hi) return lo, so zero edges stay zero and the unit diagonal
+    stays 1. Returns a (size, n, n) array.
+    """
+    rng = np.random.default_rng(rng)
+    lo, mid, hi = W[..., 0], W[..., 1], W[..., 2]
+    width = hi - lo
+    u = rng.random((size,) + lo.shape)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        c = np.where(width > 0, (mid - lo) / width, 0.0)
+    left = lo + np.sqrt(u * width * (mid - lo))
+    right = hi - np.sqrt((1.0 - u) * width * (hi - mid))
+    return np.where(u < c, left, right)
+
+
+def crisp_multiply_sum(Wc, X):
+    """Row sums of crisp-weight × TFN products for a (B, n, n) batch of W.
+
+    With a crisp weight w the 9 endpoint products reduce to (w·lo, w·mid,
+    w·hi), reordered when w < 0, so the sums are two matrix products over
+    the positive and negative parts of W.
+    """
+    P = np.maximum(Wc, 0.0) @ X
+    N = np.minimum(Wc, 0.0) @ X
+    return np.stack([P[..., 0] + N[..., 2], P[..., 1] + N[..., 1], P[..., 2] + N[..., 0]], axis=-1)
+
+
+def simulate_crisp_batch(Wc, X0, clamp=None, lam=1.0, iterations=15):
+    """Centroid histories (B, iterations+1, n) for a batch of crisp W realisations."""
+    X = np.broadcast_to(np.asarray(X0, dtype=float), Wc.shape[:-1] + (3,))
+    X0 = X
+    crisp = np.empty((Wc.shape[0], iterations + 1, Wc.shape[1]))
+    crisp[:, 0] = defuzzify_array(X)
+    for t in range(iterations):
+        X = np.tanh(lam * crisp_multiply_sum(Wc, X))
+        if clamp is not None and np.any(clamp):
+            X = np.where(clamp[..., None], X0, X)
+        crisp[:, t + 1] = defuzzify_array(X)
+    return crisp
+
+
+def init_stats(shape, bins=400, value_range=(-1.0, 1.0)):
+    """Empty streaming statistics for observations of the given shape.
+
+    Keeps a running count, mean and sum of squared deviations (Welford) and
+    a fixed-bin histogram per cell as a quantile sketch; values outside
+    `value_range` fall into the edge bins. Memory does not grow with the
+    number of observations.
+    """
+    return {
+        "count": 0,
+        "mean": np.zeros(shape),
+        "m2": np.zeros(shape),
+        "min": np.full(shape, np.inf),
+        "max": np.full(shape, -np.inf),
+        "edges": np.linspace(value_range[0], value_range[1], bins + 1),
+        "hist": np.zeros(shape + (bins,), dtype=np.int64),
+    }
+
+
+def update_stats(stats, batch):
+    """Merge a (B, ...) batch of observations into `stats` in place."""
+    B = batch.shape[0]
+    if B == 0:
+        return stats
+    mean_b = batch.mean(axis=0)
+    m2_b = ((batch - mean_b) ** 2).sum(axis=0)
+    n_a = stats["count"]
+    total = n_a + B
+    delta = mean_b - stats["mean"]
+    # Chan et al. pairwise merge of (count, mean, M2)
+    stats["mean"] += delta * (B / total)
+    stats["m2"] += m2_b + delta ** 2 * (n_a * B / total)
+    stats["count"] = total
+    np.minimum(stats["min"], batch.min(axis=0), out=stats["min"])
+    np.maximum(stats["max"], batch.max(axis=0), out=stats["max"])
+    edges = stats["edges"]
+    bins = len(edges) - 1
+    idx = np.clip(np.searchsorted(edges, batch, side='right') - 1, 0, bins - 1)
+    cells = np.arange(np.prod(batch.shape[1:], dtype=np.int64)).reshape(batch.shape[1:])
+    flat = np.bincount((cells * bins + idx).ravel(), minlength=cells.size * bins)
+    stats["hist"] += flat.reshape(stats["hist"].shape)
+    return stats
+
+
+def stats_std(stats):
+    """Sample standard deviation per cell."""
+    return np.sqrt(stats["m2"] / max(stats["count"] - 1, 1))
+
+
+def stats_quantile(stats, q):
+    """Approximate q-quantile per cell from the histogram sketch.
+
+    Interpolates linearly inside the bin holding the target rank and is
+    clipped to the exact running min/max.
+    """
+    hist = stats["hist"]
+    edges = stats["edges"]
+    cum = np.cumsum(hist, axis=-1)
+    target = q * stats["count"]
+    k = np.minimum((cum < target).sum(axis=-1, keepdims=True), hist.shape[-1] - 1)
+    below = np.take_along_axis(cum, k, axis=-1) - np.take_along_axis(hist, k, axis=-1)
+    inside = np.take_along_axis(hist, k, axis=-1)
+    frac = np.where(inside > 0, (target - below) / np.maximum(inside, 1), 0.5)
+    k, frac = k[..., 0], frac[..., 0]
+    value = edges[k] + np.clip(frac, 0.0, 1.0) * (edges[k + 1] - edges[k])
+    return np.clip(value, stats["min"], stats["max"])
+
+
+def monte_carlo(W, X0, clamp=None, lam=1.0, iterations=15, n_samples=1000,
+                quantiles=(0.05, 0.5, 0.95), batch_size=None, seed=None, bins=400):
+    """Propagate TFN weight uncertainty through the GFCM by Monte Carlo.
+
+    Draws `n_samples` crisp realisations of W, simulates them in batches and
+    streams the centroid trajectories into running statistics, so memory is
+    independent of `n_samples`. Returns a dict with `mean`, `std`, `min`,
+    `max` and `quantiles` ({q: array}), each of shape (iterations+1, n),
+    plus `n_samples`. A `fuzzy_sparse.SparseWeights` W is expanded to dense
+    first, since every sampled batch of W is dense anyway.
+    """
+    rng = np.random.default_rng(seed)
+    if hasattr(W, "indptr"):
+        from fuzzy_sparse import sparse_to_dense
+        W = sparse_to_dense(W)
+    W = np.asarray(W, dtype=float)
+    n = W.shape[0]
+    batch_size = batch_size or max(1, BATCH_ELEMENTS // max(1, n * n))
+    stats = init_stats((iterations + 1, n), bins=bins)
+    done = 0
+    while done < n_samples:
+        size = min(batch_size, n_samples - done)
+        Wc = sample_crisp_weights(W, size, rng)
+        update_stats(stats, simulate_crisp_batch(Wc, X0, clamp, lam, iterations))
+        done += size
+    return {
+        "mean": stats["mean"],
+        "std": stats_std(stats),
+        "min": stats["min"],
+        "max": stats["max"],
+        "quantiles": {q: stats_quantile(stats, q) for q in quantiles},
+        "n_samples": stats["count"],
+    }
@@ -3,6 +3,8 @@ import numpy as np
 import pandas as pd
 import re
 
+from fuzzy_profile import profiled, stage
+
 def parse_interval(cell):
     # Handle if already sequence
     if isinstance(cell, (list, tuple, np.ndarray)):
@@ -40,20 +42,23 @@ def defuzzify(tfn):
     lo, mid, hi = tfn
     return (lo + mid + hi) / 3.0
 
+@profiled("fuzzy_pipeline")
 def fuzzy_pipeline(W_df, I_df, clamp_concepts=None, lam=1.0, iterations=15):
     n = len(W_df)
     names = list(W_df.index)
     # Initialize fuzzy weight matrix
     W_fuzz = np.empty((n, n), dtype=object)
-    for i, row in enumerate(names):
-        for j, col in enumerate(names):
-            if row == col:
-                W_fuzz[i, j] = (1.0, 1.0, 1.0)
-            else:
-                W_fuzz[i, j] = parse_interval(W_df.loc[row, col])
+    with stage("parse_W"):
+        for i, row in enumerate(names):
+            for j, col in enumerate(names):
+                if row == col:
+                    W_fuzz[i, j] = (1.0, 1.0, 1.0)
+                else:
+                    W_fuzz[i, j] = parse_interval(W_df.loc[row, col])
     # Initialize fuzzy state
     C = [None] * (iterations + 1)
-    C[0] = [parse_interval(I_df.iloc[0, j]) for j in range(n)]
+    with stage("parse_I"):
+        C[0] = [parse_interval(I_df.iloc[0, j]) for j in range(n)]
     # Simulation
     crisp_hist = []
     for t in range(iterations + 1):
@@ -63,37 +68,45 @@ def fuzzy_pipeline(W_df, I_df, clamp_concepts=None, lam=1.0, iterations=15):
             break
         # Next state computation
         next_state = []
-        for i in range(n):
-            # sum of fuzzy multiplications
-            sum_tfn = (0.0, 0.0, 0.0)
-            for j in range(n):
-                prod = fuzzy_multiply(W_fuzz[i, j], C[t][j])
-                sum_tfn = (sum_tfn[0] + prod[0],
-                           sum_tfn[1] + prod[1],
-                           sum_tfn[2] + prod[2])
-            # activation
-            activated = tuple(np.tanh(lam * np.array(sum_tfn)))
-            # clamp if needed
-            if clamp_concepts and names[i] in clamp_concepts:
-                next_state.append(C[0][i])
-            else:
-                next_state.append(activated)
+        with stage("iteration"):
+            for i in range(n):
+                # sum of fuzzy multiplications
+                with stage("multiply_accumulate"):
+                    sum_tfn = (0.0, 0.0, 0.0)
+                    for j in range(n):
+                        prod = fuzzy_multiply(W_fuzz[i, j], C[t][j])
+                        sum_tfn = (sum_tfn[0] + prod[0],
+                                   sum_tfn[1] + prod[1],
+                                   sum_tfn[2] + prod[2])
+                # activation
+                with stage("tanh"):
+                    activated = tuple(np.tanh(lam * np.array(sum_tfn)))
+                # clamp if needed
+                if clamp_concepts and names[i] in clamp_concepts:
+                    next_state.append(C[0][i])
+                else:
+                    next_state.append(activated)
         C[t+1] = next_state
     return C, crisp_hist, names
 
+@profiled("graph_metrics")
+def compute_graph_metrics(G, epsilon=None, seed=None):
+    """Compute a variety of network metrics on graph G.
 
-import networkx as nx
-import numpy as np
-
-def compute_graph_metrics(G):
-    """Compute a variety of network metrics on graph G."""
+    With an error budget `epsilon`, betweenness is estimated from sampled
+    pivot sources (see `fuzzy_metrics.betweenness_sample_size`).
+    """
+    import networkx as nx
+    from fuzzy_metrics import betweenness_sample_size
     metrics = {}
     try:
         metrics["density"] = nx.density(G)
         metrics["avg_degree"] = np.mean([deg for _, deg in G.degree()])
         metrics["assortativity"] = nx.degree_assortativity_coefficient(G)
         metrics["clustering_coeff"] = nx.average_clustering(G.to_undirected())
-        metrics["betweenness"] = nx.betweenness_centrality(G)
+        k = betweenness_sample_size(G.number_of_nodes(), epsilon)
+        metrics["betweenness"] = nx.betweenness_centrality(
+            G, k=None if k == G.number_of_nodes() else k, seed=seed)
         metrics["closeness"] = nx.closeness_centrality(G)
         try:
             if nx.is_connected(G.to_undirected()):
@@ -106,3 +119,45 @@ def compute_graph_metrics(G):
     except Exception as e:
         metrics["error"] = str(e)
     return metrics
+
+
+def main(argv=None):
+    """Run one simulation from the command line and print the final state."""
+    import argparse
+    from fuzzy_io import model_from_frames, read_table
+    from fuzzy_engine import clamp_mask, simulate
+
+    parser = argparse.ArgumentParser(description="Run a Generalised Fuzzy Cognitive Map.")
+    parser.add_argument("weights", help="CSV/XLSX n×n matrix of fuzzy triples")
+    parser.add_argument("inputs", help="CSV/XLSX single row of n fuzzy triples")
+    parser.add_argument("--iterations", type=int, default=15)
+    parser.add_argument("--lam", type=float, default=1.0, help="tanh steepness λ")
+    parser.add_argument("--clamp", action="append", default=[], help="concept to clamp (repeatable)")
+    parser.add_argument("--float32", action="store_true", help="simulate in single precision")
+    parser.add_argument("--steady-state", action="store_true",
+                        help="solve for the fixed point (fuzzy_steady) instead of iterating")
+    args = parser.parse_args(argv)
+
+    model = model_from_frames(read_table(args.weights), read_table(args.inputs))
+    names = model["names"]
+    mask = clamp_mask(names, args.clamp)
+    if args.steady_state:
+        from fuzzy_steady import steady_state
+        final, centroids, info = steady_state(model["W"], model["I"], mask, args.lam)
+        header = (f"Steady state ({info['status']}, {info['evaluations']} evaluations, "
+                  f"residual {info['residual']:.1e}, contraction bound {info['contraction']:.3f}):")
+        if info.get("reached", True) is None:
+            header += "\n  (a fixed point; not confirmed to be where simulation from the inputs settles)"
+    else:
+        fuzzy_hist, crisp_hist = simulate(model["W"], model["I"], mask, args.lam, args.iterations,
+                                          np.float32 if args.float32 else np.float64)
+        final, centroids = fuzzy_hist[-1], crisp_hist[-1]
+        header = f"Final state after {args.iterations} iterations:"
+    width = max(len(str(c)) for c in names) if names else 0
+    print(header)
+    for c, (lo, mid, hi), cx in zip(names, final, centroids):
+        print(f"  {str(c):<{width}}  [{lo:.4f}, {mid:.4f}, {hi:.4f}]  centroid={cx:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""Opt-in per-stage instrumentation.
+
+Code marks stages with `with stage("name"):` blocks or the `@profiled("name")`
+decorator. While profiling is off (the default) a stage costs one flag check.
+Once `enable()` is called, every stage records its wall time and call count
+under its nesting path (e.g. "simulate/step/multiply"). With
+`enable(memory=True)` it also records, through tracemalloc, the peak memory
+allocated inside the stage and the net memory it left allocated. `enable()`
+profiles the whole process; `report()` returns the collected numbers.
+
+To profile one caller only (e.g. one Streamlit session), `attach` a
+`Session` to the threads that run its work: stages on those threads are
+recorded into the session's own statistics and nothing else is affected.
+"""
+import functools
+import threading
+import time
+import tracemalloc
+import weakref
+from contextlib import contextmanager, nullcontext
+
+import pandas as pd
+
+_STATE = {"enabled": False, "memory": False, "tracing": False}
+_STATS = {}
+_LOCK = threading.Lock()
+_LOCAL = threading.local()
+_NULL = nullcontext()
+# Sessions that asked for memory tracing; dropped sessions fall out when collected
+_TRACERS = weakref.WeakSet()
+
+
+class Session:
+    """Stage statistics of one caller, recorded only on threads it is attached to."""
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.stats = {}
+
+
+def _update_tracing():
+    # tracemalloc is process-wide: run it while anyone wants it, and stop it
+    # again only if this module was the one that started it
+    with _LOCK:
+        wanted = _STATE["memory"] or any(s.memory for s in _TRACERS)
+        if wanted and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _STATE["tracing"] = True
+        elif not wanted and _STATE["tracing"]:
+            tracemalloc.stop()
+            _STATE["tracing"] = False
+
+
+def enabled():
+    return _STATE["enabled"]
+
+
+def enable(memory=False):
+    """Start recording stages process-wide; `memory=True` also traces allocations (slower)."""
+    _STATE.update(enabled=True, memory=memory)
+    _update_tracing()
+
+
+def disable():
+    _STATE.update(enabled=False, memory=False)
+    _update_tracing()
+
+
+def attach(session):
+    """Record stages run on this thread into `session` (None detaches the thread)."""
+    _LOCAL.session = session
+    if session is not None and session.memory:
+        _TRACERS.add(session)
+    _update_tracing()
+
+
+def attached():
+    """The session attached to this thread, or None."""
+    return getattr(_LOCAL, "session", None)
+
+
+def set_session_memory(session, memory):
+    """Turn allocation tracing of `session` on or off."""
+    session.memory = memory
+    if memory:
+        _TRACERS.add(session)
+    else:
+        _TRACERS.discard(session)
+    _update_tracing()
+
+
+def reset(session=None):
+    """Forget every recorded stage (of `session`, or the process-wide ones)."""
+    with _LOCK:
+        (_STATS if session is None else session.stats).clear()
+
+
+@contextmanager
+def profiling(memory=False):
+    """Profile the enclosed block, then restore the previous setting."""
+    previous = dict(_STATE)
+    enable(memory)
+    try:
+        yield
+    finally:
+        if not previous["enabled"]:
+            disable()
+        else:
+            enable(previous["memory"])
+
+
+def _stack():
+    if not hasattr(_LOCAL, "stack"):
+        _LOCAL.stack = []
+    return _LOCAL.stack
+
+
+@contextmanager
+def _recording(name):
+    stack = _stack()
+    path = "/".join([f["name"] for f in stack] + [name])
+    session = attached()
+    stats = _STATS if session is None else session.stats
+    memory = (_STATE["memory"] if session is None else session.memory) and tracemalloc.is_tracing()
+    frame = {"name": name}
+    if memory:
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+        tracemalloc.reset_peak()
+        frame.update(start=current, peak=current)
+    stack.append(frame)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stack.pop()
+        alloc_peak = alloc_net = 0
+        if memory:
+            current, peak = tracemalloc.get_traced_memory()
+            frame["peak"] = max(frame["peak"], peak)
+            alloc_peak, alloc_net = frame["peak"] - frame["start"], current - frame["start"]
+            if stack:
+                stack[-1]["peak"] = max(stack[-1]["peak"], frame["peak"])
+            tracemalloc.reset_peak()
+        with _LOCK:
+            s = stats.setdefault(path, {"calls": 0, "total_s": 0.0, "max_s": 0.0,
+                                         "alloc_peak_bytes": 0, "alloc_net_bytes": 0})
+            s["calls"] += 1
+            s["total_s"] += elapsed
+            s["max_s"] = max(s["max_s"], elapsed)
+            s["alloc_peak_bytes"] = max(s["alloc_peak_bytes"], alloc_peak)
+            s["alloc_net_bytes"] += alloc_net
+
+
+def stage(name):
+    """Context manager timing one stage; a shared no-op while profiling is off."""
+    return _recording(name) if _STATE["enabled"] or attached() is not None else _NULL
+
+
+def profiled(name=None):
+    """Decorator recording every call of a function as a stage."""
+    def wrap(fn):
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if not _STATE["enabled"] and attached() is None:
+                return fn(*args, **kwargs)
+            with _recording(label):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+def report(session=None):
+    """Recorded stages as {path: {calls, total_s, mean_s, max_s, alloc_peak_bytes, alloc_net_bytes}}.
+
+    Covers `session` if given, otherwise the process-wide recording.
+    """
+    with _LOCK:
+        out = {path: dict(s) for path, s in (_STATS if session is None else session.stats).items()}
+    for s in out.values():
+        s["mean_s"] = s["total_s"] / s["calls"]
+    return out
+
+
+def report_frame(session=None):
+    """`report()` as a DataFrame indexed by stage path, in call-tree order."""
+    rows = report(session)
+    df = pd.DataFrame.from_dict(rows, orient="index",
+                                columns=["calls", "total_s", "mean_s", "max_s",
+                                         "alloc_peak_bytes", "alloc_net_bytes"])
+    df.index.name = "stage"
+    df.insert(0, "depth", [p.count("/") for p in df.index])
+    return df.sort_index()
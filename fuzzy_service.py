@@ -0,0 +1,442 @@
+"""Local HTTP/JSON service for scenario runs against resident GFCM models.
+
+    python fuzzy_service.py --port 8765 --workers 4
+
+Endpoints (HTTP/1.1 keep-alive, loopback addresses only):
+
+    GET    /health                     status, resident models, workers
+    GET    /models                     resident models
+    POST   /models                     register a model; body is a .npz model
+                                       (application/octet-stream) or JSON
+                                       {"names", "W", "I", "metadata"}
+    DELETE /models/<id>                drop a model
+    POST   /models/<id>/simulate       run a batch of scenarios
+
+A simulate request is JSON: {"scenarios": [{"lam", "clamp": [names],
+"inputs": {name: tfn}}, ...], "iterations", "history", "every", "last",
+"fuzzy", "dtype", "format"}. Every scenario starts from the model's I with
+`inputs` overriding single concepts. The response is an uncompressed .npz
+(`format` "npz", the default) holding `names`, `steps`, the (B, steps, n)
+`centroids` and, with `"fuzzy": true`, the (B, steps, n, 3) `fuzzy`
+states; `format` "json" returns the same arrays as nested lists.
+
+Registered models are written to a store folder as memory-mappable .npz
+files and addressed by content hash. A persistent process pool runs the
+scenarios in chunks; each worker memory-maps a model once and keeps it, so
+requests only send scenario parameters. Only numpy and pandas are imported.
+"""
+import argparse
+import http.client
+import ipaddress
+import json
+import math
+import multiprocessing
+import os
+import re
+import socket
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+
+from fuzzy_batch_runner import cached_model
+from fuzzy_engine import history_steps, simulate_batch
+from fuzzy_io import content_hash, load_model, parse_interval_array, save_model
+
+DEFAULT_PORT = 8765
+# Models kept registered; the least recently used is dropped past this
+MAX_RESIDENT_MODELS = 32
+# Largest request body accepted, in bytes
+MAX_BODY_BYTES = 1 << 30
+# Upper bound on history elements (scenarios × steps × n × 3) computed per pool task
+TASK_ELEMENTS = 4_000_000
+RESPONSE_FORMATS = ("npz", "json")
+# Accepted request body types
+BODY_TYPES = ("application/json", "application/octet-stream")
+DTYPES = {"float64": np.float64, "float32": np.float32}
+_SIMULATE_PATH = re.compile(r"^/models/([0-9a-f]+)/simulate$")
+_MODEL_PATH = re.compile(r"^/models/([0-9a-f]+)$")
+
+
+class ServiceError(Exception):
+    """A request the service rejects, with the HTTP status to answer with."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def require_loopback(host):
+    """Raise ValueError unless `host` resolves to a loopback address."""
+    if not ipaddress.ip_address(socket.gethostbyname(host)).is_loopback:
+        raise ValueError(f"{host} is not a loopback address; the service only listens locally.")
+
+
+def _loopback_host(host_header):
+    """Whether a Host header names a loopback address (by IP or as localhost)."""
+    host = host_header.rsplit(":", 1)[0] if not host_header.endswith("]") else host_header
+    host = host.strip("[]").lower()
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def _run_chunk(path, X0, clamp, lam, iterations, steps, fuzzy, dtype):
+    # Runs in a pool worker: the model is memory-mapped once per worker
+    model = cached_model(path)
+    hist, crisp = simulate_batch(model["W"], X0, clamp, lam, iterations, dtype=dtype)
+    return crisp[:, steps], hist[:, steps] if fuzzy else None
+
+
+class SimulationService:
+    """Resident models plus a persistent worker pool; used by the HTTP handler.
+
+    `workers=1` runs scenarios in the request thread instead of a pool.
+    """
+
+    def __init__(self, store=None, workers=None, max_models=MAX_RESIDENT_MODELS):
+        self.store = Path(store or tempfile.mkdtemp(prefix="gfcm-models-"))
+        self.store.mkdir(parents=True, exist_ok=True)
+        self.max_models = max_models
+        self.models = OrderedDict()
+        # Evicted or removed models whose file in-flight requests still read, by id
+        self.retired = {}
+        self.lock = threading.RLock()
+        self.workers = workers or os.cpu_count() or 1
+        # Spawned workers: forking a process that is serving on threads is unsafe
+        self.pool = None
+        if self.workers > 1:
+            self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    def add_model(self, names, W, I, metadata=None):
+        """Register a model and return its id (the content hash of W, I and the names)."""
+        names = [str(c) for c in names]
+        W = np.ascontiguousarray(W, dtype=float)
+        I = np.ascontiguousarray(I, dtype=float)
+        n = len(names)
+        if W.shape != (n, n, 3) or I.shape != (n, 3):
+            raise ServiceError(400, f"Expected W of shape ({n}, {n}, 3) and I of shape ({n}, 3), "
+                                    f"got {W.shape} and {I.shape}.")
+        model_id = content_hash(json.dumps(names).encode(), W.tobytes(), I.tobytes())[:16]
+        path = self.store / f"{model_id}.npz"
+        with self.lock:
+            if model_id in self.retired:
+                self.models[model_id] = self.retired.pop(model_id)
+            elif model_id not in self.models:
+                if not path.exists():
+                    save_model(path, names, W, I, metadata)
+                self.models[model_id] = dict(load_model(path), id=model_id, path=str(path), active=0)
+            self.models.move_to_end(model_id)
+            while len(self.models) > self.max_models:
+                self._retire(self.models.popitem(last=False)[1])
+            return model_id
+
+    def _retire(self, model):
+        # Called with the lock held: the file goes once no request uses it
+        if model["active"]:
+            self.retired[model["id"]] = model
+        else:
+            Path(model["path"]).unlink(missing_ok=True)
+
+    def _release(self, model):
+        with self.lock:
+            model["active"] -= 1
+            if not model["active"] and self.retired.get(model["id"]) is model:
+                del self.retired[model["id"]]
+                Path(model["path"]).unlink(missing_ok=True)
+
+    def add_model_body(self, body, content_type):
+        """Register a model from a request body (.npz bytes or JSON arrays)."""
+        try:
+            if content_type.startswith("application/json"):
+                data = json.loads(body)
+                W, I = np.asarray(data["W"], dtype=float), np.asarray(data["I"], dtype=float)
+                names = data.get("names") or [f"C{k + 1}" for k in range(len(I))]
+                return self.add_model(names, W, I, data.get("metadata"))
+            model = load_model(BytesIO(body))
+        except ServiceError:
+            raise
+        except (ValueError, KeyError, TypeError, OSError) as e:
+            raise ServiceError(400, f"Cannot read model: {e}")
+        return self.add_model(model["names"], model["W"], model["I"], model["metadata"])
+
+    def get(self, model_id):
+        with self.lock:
+            if model_id not in self.models:
+                raise ServiceError(404, f"No model {model_id}.")
+            self.models.move_to_end(model_id)
+            return self.models[model_id]
+
+    def remove(self, model_id):
+        with self.lock:
+            model = self.models.pop(model_id, None)
+            if model is None:
+                raise ServiceError(404, f"No model {model_id}.")
+            self._retire(model)
+
+    def summary(self):
+        with self.lock:
+            return [{"model_id": k, "n": len(m["names"]), "metadata": m["metadata"]}
+                    for k, m in self.models.items()]
+
+    def scenario_arrays(self, model, scenarios):
+        """(B, n, 3) initial states, (B, n) clamp masks and (B,) λ of a scenario list."""
+        names = model["names"]
+        index = {c: k for k, c in enumerate(names)}
+        B = len(scenarios)
+        X0 = np.repeat(np.asarray(model["I"], dtype=float)[None], B, axis=0)
+        clamp = np.zeros((B, len(names)), dtype=bool)
+        lam = np.ones(B)
+        for b, sc in enumerate(scenarios):
+            if not isinstance(sc, dict):
+                raise ServiceError(400, f"Scenario {b} is not an object.")
+            if not isinstance(sc.get("clamp", []), list) or not isinstance(sc.get("inputs", {}), dict):
+                raise ServiceError(400, f"Scenario {b}: 'clamp' must be a list and 'inputs' an object.")
+            unknown = [c for c in list(sc.get("clamp", ())) + list(sc.get("inputs", {})) if c not in index]
+            if unknown:
+                raise ServiceError(400, f"Scenario {b}: unknown concept(s) {unknown}.")
+            lam[b] = float(sc.get("lam", 1.0))
+            clamp[b, [index[c] for c in sc.get("clamp", ())]] = True
+            inputs = sc.get("inputs", {})
+            empty = [c for c, value in inputs.items() if value is None or value == "" or value == []]
+            if empty:
+                raise ServiceError(400, f"Scenario {b}: empty input value(s) for {empty}.")
+            if inputs:
+                cells = np.empty(len(inputs), dtype=object)
+                for k, value in enumerate(inputs.values()):
+                    cells[k] = value
+                X0[b, [index[c] for c in inputs]] = parse_interval_array(cells, labels=(list(inputs),))
+        return X0, clamp, lam
+
+    def simulate(self, model_id, request):
+        """Run a simulate request; returns (names, steps, centroids, fuzzy or None)."""
+        with self.lock:
+            model = self.get(model_id)
+            # Keeps the model file on disk until this request's tasks are done
+            model["active"] += 1
+        try:
+            return self._simulate(model, request)
+        finally:
+            self._release(model)
+
+    def _simulate(self, model, request):
+        scenarios = request.get("scenarios") or [{}]
+        if not isinstance(scenarios, list):
+            raise ServiceError(400, "'scenarios' must be a list of objects.")
+        try:
+            iterations = int(request.get("iterations", 15))
+            every, last = int(request.get("every", 1)), int(request.get("last", 1))
+            if iterations < 0 or every < 1 or last < 1:
+                raise ServiceError(400, "Need iterations ≥ 0, every ≥ 1 and last ≥ 1.")
+            steps = history_steps(iterations, request.get("history", "full"), every, last)
+            dtype = DTYPES[request.get("dtype", "float64")]
+            X0, clamp, lam = self.scenario_arrays(model, scenarios)
+        except ServiceError:
+            raise
+        except (ValueError, KeyError, TypeError) as e:
+            raise ServiceError(400, f"Bad simulate request: {e}")
+        fuzzy = bool(request.get("fuzzy", False))
+        n, B = len(model["names"]), len(scenarios)
+        per_task = max(1, min(math.ceil(B / self.workers), TASK_ELEMENTS // ((iterations + 1) * n * 3)))
+        chunks = [(model["path"], X0[a:a + per_task], clamp[a:a + per_task], lam[a:a + per_task],
+                   iterations, steps, fuzzy, dtype) for a in range(0, B, per_task)]
+        if self.pool is None:
+            parts = [_run_chunk(*c) for c in chunks]
+        else:
+            parts = [f.result() for f in [self.pool.submit(_run_chunk, *c) for c in chunks]]
+        centroids = np.concatenate([p[0] for p in parts])
+        states = np.concatenate([p[1] for p in parts]) if fuzzy else None
+        return model["names"], steps, centroids, states
+
+
+def encode_result(names, steps, centroids, fuzzy=None, fmt="npz"):
+    """Response body and content type of a simulate result."""
+    if fmt == "json":
+        body = {"names": names, "steps": steps.tolist(), "centroids": centroids.tolist()}
+        if fuzzy is not None:
+            body["fuzzy"] = fuzzy.tolist()
+        return json.dumps(body).encode(), "application/json"
+    buf = BytesIO()
+    arrays = {"names": np.array(names, dtype=str), "steps": steps, "centroids": centroids}
+    if fuzzy is not None:
+        arrays["fuzzy"] = fuzzy
+    np.savez(buf, **arrays)
+    return buf.getvalue(), "application/octet-stream"
+
+
+def decode_result(body, content_type):
+    """Inverse of `encode_result`: a dict of arrays."""
+    if content_type.startswith("application/json"):
+        data = json.loads(body)
+        out = {"names": data["names"], "steps": np.array(data["steps"]),
+               "centroids": np.array(data["centroids"])}
+        if "fuzzy" in data:
+            out["fuzzy"] = np.array(data["fuzzy"])
+        return out
+    with np.load(BytesIO(body)) as npz:
+        out = {k: npz[k] for k in npz.files}
+    out["names"] = out["names"].tolist()
+    return out
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _reply(self, status, body, content_type="application/json"):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            # The unread body would corrupt the next request on this connection
+            self.close_connection = True
+            raise ServiceError(413, f"Request body over {MAX_BODY_BYTES} bytes.")
+        return self.rfile.read(length)
+
+    def _handle(self, method):
+        service = self.server.service
+        try:
+            body = self._body()
+            if not ipaddress.ip_address(self.client_address[0]).is_loopback:
+                raise ServiceError(403, "Only loopback clients are served.")
+            if not _loopback_host(self.headers.get("Host", "")):
+                # A web page in a local browser reaches us under its own (rebound) host name
+                raise ServiceError(403, "Host header must name a loopback address.")
+            content_type = self.headers.get("Content-Type", "").split(";", 1)[0].strip().lower()
+            if body and content_type not in BODY_TYPES:
+                # text/plain and form posts need no CORS preflight, so cross-site pages can send them
+                raise ServiceError(415, f"Content-Type must be one of {BODY_TYPES}.")
+            path = self.path.split("?", 1)[0].rstrip("/") or "/"
+            if method == "GET" and path == "/health":
+                self._reply(200, {"status": "ok", "models": len(service.models), "workers": service.workers})
+            elif method == "GET" and path == "/models":
+                self._reply(200, service.summary())
+            elif method == "POST" and path == "/models":
+                model_id = service.add_model_body(body, content_type)
+                model = service.get(model_id)
+                self._reply(201, {"model_id": model_id, "n": len(model["names"]), "names": model["names"]})
+            elif method == "DELETE" and _MODEL_PATH.match(path):
+                service.remove(_MODEL_PATH.match(path).group(1))
+                self._reply(200, {"deleted": _MODEL_PATH.match(path).group(1)})
+            elif method == "POST" and _SIMULATE_PATH.match(path):
+                if body and content_type != "application/json":
+                    raise ServiceError(415, "Simulate requests must be application/json.")
+                try:
+                    request = json.loads(body or b"{}")
+                except ValueError as e:
+                    raise ServiceError(400, f"Request is not JSON: {e}")
+                if not isinstance(request, dict):
+                    raise ServiceError(400, "Simulate request must be a JSON object.")
+                fmt = request.get("format", "npz")
+                if fmt not in RESPONSE_FORMATS:
+                    raise ServiceError(400, f"Unknown format {fmt!r}; expected one of {RESPONSE_FORMATS}.")
+                result = service.simulate(_SIMULATE_PATH.match(path).group(1), request)
+                self._reply(200, *encode_result(*result, fmt=fmt))
+            else:
+                raise ServiceError(404, f"No route for {method} {path}.")
+        except ServiceError as e:
+            self._reply(e.status, {"error": str(e)})
+        except Exception as e:
+            self._reply(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+
+def make_server(host="127.0.0.1", port=DEFAULT_PORT, service=None, quiet=False):
+    """Threaded HTTP server bound to a loopback address (port 0 picks a free one)."""
+    require_loopback(host)
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.service = service or SimulationService()
+    server.quiet = quiet
+    return server
+
+
+class Client:
+    """Minimal client over one kept-alive connection; not thread-safe, use one per thread."""
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, timeout=300):
+        self.conn = http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def close(self):
+        self.conn.close()
+
+    def request(self, method, path, body=None, content_type="application/json"):
+        headers = {"Content-Type": content_type} if body is not None else {}
+        self.conn.request(method, path, body=body, headers=headers)
+        resp = self.conn.getresponse()
+        data = resp.read()
+        if resp.status >= 400:
+            raise RuntimeError(f"{method} {path} -> {resp.status}: {json.loads(data).get('error')}")
+        return data, resp.getheader("Content-Type", "")
+
+    def upload_model(self, names, W, I, metadata=None):
+        """Register a model from arrays, sent as .npz; returns its id."""
+        buf = BytesIO()
+        save_model(buf, names, W, I, metadata)
+        data, _ = self.request("POST", "/models", buf.getvalue(), "application/octet-stream")
+        return json.loads(data)["model_id"]
+
+    def simulate(self, model_id, scenarios, **options):
+        """Run scenarios; returns a dict with `names`, `steps`, `centroids` (and `fuzzy`)."""
+        body = json.dumps(dict(options, scenarios=scenarios)).encode()
+        return decode_result(*self.request("POST", f"/models/{model_id}/simulate", body))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve GFCM scenario runs over local HTTP.")
+    parser.add_argument("--host", default="127.0.0.1", help="loopback address to bind")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--store", default=None, help="folder for registered models (default: a temp folder)")
+    parser.add_argument("--quiet", action="store_true", help="do not log requests")
+    args = parser.parse_args(argv)
+
+    service = SimulationService(args.store, args.workers)
+    server = make_server(args.host, args.port, service, args.quiet)
+    print(f"GFCM service on http://{args.host}:{server.server_port} "
+          f"({service.workers} workers, models in {service.store})", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
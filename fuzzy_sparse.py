@@ -0,0 +1,272 @@
+import codecs
+import json
+import re
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from fuzzy_engine import fuzzy_multiply_array
+from fuzzy_io import parse_interval_array
+from fuzzy_profile import profiled
+
+# CSR-like storage of the non-zero TFN edges: row i owns values[indptr[i]:indptr[i+1]]
+SparseWeights = namedtuple("SparseWeights", ["indptr", "indices", "values"])
+# Builder graph: node labels, node TFN cells and {(i, j): TFN cell} for the edges
+Graph = namedtuple("Graph", ["names", "tfns", "edges"])
+# Default TFN of nodes and edges without one, as in the builder
+DEFAULT_TFN = "0.0,0.0,0.0"
+# Characters of a graph upload read per chunk
+GRAPH_READ_CHUNK = 1 << 20
+_JSON_SPACE = re.compile(r"[ \t\n\r]*")
+# Characters that extend a JSON number decoded so far
+_NUMBER_CONTINUATION = frozenset("0123456789.eE+-")
+
+
+def normalise_elements(data):
+    """Return flat list of {group:'nodes'|'edges', data:{...}}"""
+    if isinstance(data, dict):
+        if "elements" in data:
+            out = []
+            for g in ("nodes", "edges"):
+                out += [{"group": g, "data": d.get("data", d)} for d in data["elements"].get(g, [])]
+            return out
+        if "nodes" in data and "edges" in data:
+            return ([{"group": "nodes", "data": d.get("data", d)} for d in data["nodes"]] +
+                    [{"group": "edges", "data": d.get("data", d)} for d in data["edges"]])
+        return []
+    return data if isinstance(data, list) else []
+
+
+class _JsonStream:
+    """Incremental reader of a JSON text that decodes one value at a time."""
+
+    def __init__(self, fp, chunk=GRAPH_READ_CHUNK):
+        self.fp, self.chunk = fp, chunk
+        self.decoder = json.JSONDecoder()
+        self.utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.buf, self.pos, self.eof = "", 0, False
+
+    def _fill(self):
+        data = self.fp.read(self.chunk)
+        self.eof = not data
+        text = data if isinstance(data, str) else self.utf8.decode(data, final=self.eof)
+        self.buf = self.buf[self.pos:] + text
+        self.pos = 0
+        return not self.eof
+
+    def peek(self):
+        """Next non-whitespace character, or '' at the end of the input."""
+        while True:
+            self.pos = _JSON_SPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def take(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in graph JSON, found {found or 'end of input'!r}.")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A number cut by the chunk edge decodes as its prefix ("1" of "1.5"):
+                # accept it only once the character after it cannot continue it
+                cut = (isinstance(obj, (int, float)) and not isinstance(obj, bool)
+                       and (end == len(self.buf) or self.buf[end] in _NUMBER_CONTINUATION))
+                if self.eof or not cut:
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def array(self):
+        """Yield the items of the array at the cursor."""
+        self.take("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == "]":
+                self.pos += 1
+                return
+            self.take(",")
+
+    def keys(self):
+        """Yield the keys of the object at the cursor; the caller consumes each value."""
+        self.take("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.take(":")
+            yield key
+            if self.peek() == "}":
+                self.pos += 1
+                return
+            self.take(",")
+
+
+def _stream_groups(stream, groups):
+    for key in stream.keys():
+        if key in groups and stream.peek() == "[":
+            for d in stream.array():
+                yield {"group": key, "data": d.get("data", d) if isinstance(d, dict) else d}
+        elif key == "elements" and stream.peek() == "{":
+            yield from _stream_groups(stream, ("nodes", "edges"))
+        else:
+            stream.value()
+
+
+def iter_graph_elements(fp, chunk=GRAPH_READ_CHUNK):
+    """Stream {group, data} elements out of a builder JSON file object.
+
+    Reads `fp` (text or binary) in chunks and decodes one element at a time,
+    so memory holds a chunk of text and one element rather than the whole
+    document tree. Accepts the layouts of `normalise_elements`; `nodes` and
+    `edges` arrays are read wherever they appear at the top level or under
+    `elements`.
+    """
+    stream = _JsonStream(fp, chunk)
+    char = stream.peek()
+    if char == "[":
+        yield from stream.array()
+    elif char == "{":
+        yield from _stream_groups(stream, ("nodes", "edges"))
+    else:
+        stream.value()
+
+
+def graph_from_elements(elements):
+    """Collect builder elements into a Graph, in memory proportional to nodes plus edges.
+
+    Edges are indexed by node position once every node is known. Later
+    duplicates of an edge overwrite earlier ones and edges with an unknown
+    endpoint are dropped, as in the builder's matrix export.
+    """
+    ids, names, tfns, by_id = {}, [], [], {}
+    for el in elements:
+        d = el.get("data", {})
+        if el.get("group") == "nodes":
+            ids[str(d.get("id", ""))] = len(names)
+            names.append(d.get("label", str(d.get("id", ""))))
+            tfns.append(d.get("tfn", DEFAULT_TFN))
+        elif el.get("group") == "edges":
+            by_id[(str(d.get("source", "")), str(d.get("target", "")))] = d.get("tfn", DEFAULT_TFN)
+    edges = {}
+    for (src, tgt), tfn in by_id.items():
+        i, j = ids.get(src), ids.get(tgt)
+        if i is not None and j is not None:
+            edges[(i, j)] = tfn
+    return Graph(names, tfns, edges)
+
+
+def sparse_weights_from_coo(n, rows, cols, values):
+    """Build SparseWeights from edge triplets.
+
+    Self-loops and all-zero TFNs are dropped and the unit self-weight
+    (1.0, 1.0, 1.0) is stored on every diagonal entry, as `fuzzy_pipeline`
+    does. Every row is therefore non-empty.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    values = np.asarray(values, dtype=float).reshape(-1, 3)
+    keep = (rows != cols) & np.any(values != 0.0, axis=1)
+    diag = np.arange(n, dtype=np.int64)
+    rows = np.concatenate([rows[keep], diag])
+    cols = np.concatenate([cols[keep], diag])
+    values = np.concatenate([values[keep], np.ones((n, 3))])
+    order = np.lexsort((cols, rows))
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return SparseWeights(indptr, cols[order], values[order])
+
+
+def sparse_weights_from_dense(W):
+    """Convert an (n, n, 3) weight tensor to SparseWeights."""
+    rows, cols = np.nonzero(np.any(W != 0.0, axis=2))
+    return sparse_weights_from_coo(W.shape[0], rows, cols, W[rows, cols])
+
+
+def graph_edge_arrays(graph):
+    """Row indices, column indices and (E, 3) parsed TFNs of a Graph's edges."""
+    pairs = np.array(list(graph.edges), dtype=np.int64).reshape(-1, 2)
+    values = parse_interval_array(np.array(list(graph.edges.values()), dtype=object)).reshape(-1, 3)
+    return pairs[:, 0], pairs[:, 1], values
+
+
+def sparse_weights_from_graph(data):
+    """Build weights straight from the FCM builder's node/edge JSON or a Graph.
+
+    Accepts any layout understood by `normalise_elements`. Returns the node
+    labels, the SparseWeights and the (n, 3) initial state taken from the
+    node TFNs. Later duplicates of an edge overwrite earlier ones, as in the
+    builder's matrix export.
+    """
+    graph = data if isinstance(data, Graph) else graph_from_elements(normalise_elements(data))
+    Ws = sparse_weights_from_coo(len(graph.names), *graph_edge_arrays(graph))
+    X0 = parse_interval_array(np.array(graph.tfns, dtype=object)).reshape(-1, 3)
+    return graph.names, Ws, X0
+
+
+def read_edge_list(file, names):
+    """Read an edge-list export (`fuzzy_io.write_edge_list`) into SparseWeights over `names`."""
+    df = pd.read_csv(file, dtype={"source": str, "target": str})
+    pos = {str(name): k for k, name in enumerate(names)}
+    rows, cols = df["source"].map(pos), df["target"].map(pos)
+    unknown = rows.isna() | cols.isna()
+    if unknown.any():
+        raise ValueError(f"{int(unknown.sum())} edge(s) name concepts not in the map, e.g. "
+                         f"{df.loc[unknown, 'source'].iloc[0]} -> {df.loc[unknown, 'target'].iloc[0]}.")
+    values = df[["lo", "mid", "hi"]].to_numpy(dtype=float)
+    return sparse_weights_from_coo(len(names), rows.to_numpy(np.int64), cols.to_numpy(np.int64), values)
+
+
+def sparse_to_dense(Ws):
+    """Expand SparseWeights back to an (n, n, 3) tensor."""
+    n = len(Ws.indptr) - 1
+    W = np.zeros((n, n, 3))
+    W[np.repeat(np.arange(n), np.diff(Ws.indptr)), Ws.indices] = Ws.values
+    return W
+
+
+def sparse_entries(Ws, rows, cols):
+    """TFNs W[rows[k], cols[k]] as a (k, 3) array; entries not stored are zero."""
+    n = len(Ws.indptr) - 1
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    # Stored entries are ordered by row, then column, so their flat keys are sorted
+    keys = np.repeat(np.arange(n, dtype=np.int64), np.diff(Ws.indptr)) * n + Ws.indices
+    wanted = rows * n + cols
+    pos = np.minimum(np.searchsorted(keys, wanted), max(len(keys) - 1, 0))
+    found = (keys[pos] == wanted) if len(keys) else np.zeros(len(wanted), dtype=bool)
+    out = np.zeros((len(wanted), 3))
+    out[found] = Ws.values[pos[found]]
+    return out
+
+
+@profiled("sparse_multiply_sum")
+def sparse_multiply_sum(Ws, X):
+    """O(nnz) row sums of fuzzy products for SparseWeights; X is (..., n, 3).
+
+    Products are scattered into flat (batch, row, component) bins with
+    `np.bincount`, which accumulates each bin in column order like the
+    reference loop.
+    """
+    n = len(Ws.indptr) - 1
+    batch = X.shape[:-2]
+    B = int(np.prod(batch))
+    tfn = fuzzy_multiply_array(Ws.values, X[..., Ws.indices, :]).reshape(B, -1, 3)
+    rows = np.repeat(np.arange(n), np.diff(Ws.indptr))
+    bins = (np.arange(B)[:, None, None] * n + rows[None, :, None]) * 3 + np.arange(3)
+    S = np.bincount(bins.ravel(), weights=tfn.ravel(), minlength=B * n * 3)
+    return S.reshape(batch + (n, 3))
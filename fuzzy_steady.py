@@ -0,0 +1,233 @@
+"""Accelerated steady-state solver for GFCMs.
+
+`steady_state` finds the fuzzy fixed point X = F(X) of the GFCM update
+F(X) = tanh(λ · Σ_j W[i, j] ⊗ X[j]) (clamped rows held at X0). It takes
+plain (Picard) steps X ← F(X) through the nonlinear transient, then, once
+the largest change per step is below `accelerate_below`, switches to
+Anderson acceleration: every step extrapolates from the last few states
+and residuals, which removes most of the slow linear tail of the
+iteration. F is only piecewise smooth (min, median and max of products),
+so no Jacobian is formed.
+
+Alongside the state it returns a certificate:
+
+- `residual`: max |F(X) - X| of the returned state.
+- `contraction`: an upper bound q on the Lipschitz constant of F in a
+  weighted max norm, from λ and the dominant eigenvalue of |W|. q < 1
+  proves the fixed point is unique and reached by simulation from any
+  start, and `error_bound` then bounds max |X - X*|.
+- `local_rate`: the dominant eigenvalue modulus of F's Jacobian at X,
+  estimated by power iteration on finite differences. Below 1 the fixed
+  point attracts nearby states (`stable`), and `predicted_steps` estimates
+  how many plain steps a simulation from X0 needs to settle within `tol`.
+- `reached`: whether a short run of plain steps from X0 was seen to head
+  for this fixed point. A stable map can have several attractors and the
+  extrapolation may land on one the simulation does not go to; when the
+  check sees simulation settle elsewhere, the solve is redone with plain
+  steps. None means the check was inconclusive: the state is a fixed
+  point, not necessarily the outcome of simulating from X0.
+"""
+import math
+
+import numpy as np
+
+from fuzzy_engine import defuzzify_array, fuzzy_step, weights_as
+from fuzzy_profile import profiled
+
+# States and residuals kept by the Anderson extrapolation
+ANDERSON_MEMORY = 10
+# Largest change per step at which plain steps give way to Anderson steps
+ACCELERATE_BELOW = 1e-2
+# ...once the ratio of successive changes varies by less than this (the linear regime)
+RATE_SETTLED = 0.02
+# An accelerated step whose residual grows past this factor is replaced by a plain step
+SAFEGUARD_FACTOR = 2.0
+# Power-iteration steps behind `contraction` and `local_rate`
+SPECTRAL_ITERATIONS = 50
+LOCAL_RATE_ITERATIONS = 20
+# Finite-difference step of the local rate estimate
+FD_STEP = 1e-7
+# Plain steps from X0 that check an accelerated answer is where simulation goes...
+VERIFY_STEPS = 100
+# ...by coming within this distance of it
+VERIFY_RADIUS = 1e-3
+
+
+def _magnitudes(W):
+    """(rows, cols, max |w|) over the three components of every stored entry of W."""
+    if hasattr(W, "indptr"):
+        rows = np.repeat(np.arange(len(W.indptr) - 1), np.diff(W.indptr))
+        return rows, W.indices, np.abs(W.values).max(axis=1)
+    M = np.abs(np.asarray(W, dtype=float)).max(axis=2)
+    rows, cols = np.nonzero(M)
+    return rows, cols, M[rows, cols]
+
+
+def contraction_bound(W, lam=1.0, clamp=None, iterations=SPECTRAL_ITERATIONS):
+    """Upper bound q on the Lipschitz constant of the GFCM update, and its norm weights v.
+
+    With M[i, j] = max |W[i, j]|, every component of Σ_j W[i, j] ⊗ X[j]
+    moves by at most Σ_j M[i, j] · max |ΔX[j]| (min, median and max of the
+    products are 1-Lipschitz) and tanh is 1-Lipschitz. So in the norm
+    max_j |X[j]| / v_j, for any positive v, F is Lipschitz with constant
+    λ · max_i (M v)_i / v_i. v comes from power iteration on M, which brings
+    the bound down towards λ times the dominant eigenvalue of M. Clamped
+    concepts never change and are left out.
+    """
+    rows, cols, m = _magnitudes(W)
+    n = len(W.indptr) - 1 if hasattr(W, "indptr") else np.shape(W)[0]
+    free = np.ones(n, dtype=bool) if clamp is None else ~np.asarray(clamp, dtype=bool)
+    keep = free[rows] & free[cols]
+    rows, cols, m = rows[keep], cols[keep], m[keep]
+    v = free.astype(float)
+    best_q, best_v = math.inf, v
+    for _ in range(max(iterations, 1)):
+        Mv = np.bincount(rows, weights=m * v[cols], minlength=n)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            q = float(lam * np.max(Mv[free] / v[free], initial=0.0))
+        if q < best_q:
+            best_q, best_v = q, v
+        top = Mv.max(initial=0.0)
+        if top == 0:
+            break
+        # Keep v strictly positive on free concepts so the ratio stays a valid bound
+        v = np.where(free, np.maximum(Mv / top, 1e-12), 0.0)
+    return best_q, best_v
+
+
+def _reaches(F, x0, X, steps):
+    """Whether plain steps from x0 approach X (True), settle elsewhere (False) or neither (None)."""
+    x, res, ratio = x0, None, None
+    for k in range(steps):
+        fx = F(x)
+        new_res = float(np.max(np.abs(fx - x), initial=0.0))
+        distance = float(np.max(np.abs(x - X), initial=0.0))
+        if distance <= VERIFY_RADIUS:
+            return True, k + 1
+        new_ratio = new_res / res if res else None
+        if (ratio is not None and new_ratio is not None and new_res < ACCELERATE_BELOW
+                and new_ratio < 1 and abs(new_ratio - ratio) < RATE_SETTLED
+                and distance > 4 * new_res / (1 - new_ratio) + VERIFY_RADIUS):
+            # Linear convergence puts x about res / (1 - rate) from its own limit: not X
+            return False, k + 1
+        x, res, ratio = fx, new_res, new_ratio
+    return None, steps
+
+
+def local_rate(F, X, clamp=None, iterations=LOCAL_RATE_ITERATIONS, seed=0):
+    """Dominant eigenvalue modulus of F's Jacobian at X, by finite-difference power iteration."""
+    d = np.random.default_rng(seed).standard_normal(X.shape)
+    if clamp is not None:
+        d[np.asarray(clamp, dtype=bool)] = 0.0
+    d /= max(np.max(np.abs(d)), 1e-300)
+    FX = F(X)
+    logs = []
+    for _ in range(iterations):
+        Jd = (F(X + FD_STEP * d) - FX) / FD_STEP
+        r = np.max(np.abs(Jd))
+        if r == 0:
+            return 0.0
+        logs.append(math.log(r))
+        d = Jd / r
+    # Growth per step over the second half, once the dominant direction has taken over
+    return math.exp(np.mean(logs[len(logs) // 2:]))
+
+
+@profiled("steady_state")
+def steady_state(W, X0, clamp=None, lam=1.0, tol=1e-10, max_evaluations=1000,
+                 accelerate_below=ACCELERATE_BELOW, memory=ANDERSON_MEMORY, certify=True):
+    """Accelerated fixed point of the GFCM started from X0.
+
+    Stops once max |F(X) - X| ≤ `tol` or after `max_evaluations` calls of
+    the update. Returns the (n, 3) state, its (n,) centroids and a
+    certificate dict with `status` ('fixed_point' or 'not_converged'),
+    `evaluations`, `accelerated` (Anderson steps taken), `residual`,
+    `contraction`, `unique` and `error_bound`. For a fixed point, unless
+    `certify` is false, it also holds `local_rate`, `stable`, `reached` and
+    `predicted_steps` (see the module docstring). Should the accelerated
+    answer be an unstable fixed point, or one simulation is seen to pass
+    by, it is discarded for the one plain iteration reaches.
+    """
+    W = weights_as(W, np.float64)
+    X0 = np.asarray(X0, dtype=np.float64)
+    shape = X0.shape
+
+    def F(X):
+        return fuzzy_step(W, X.reshape(shape), lam, clamp, X0).ravel()
+
+    x = X0.ravel()
+    fx = F(x)
+    g = fx - x
+    start_residual = res = float(np.max(np.abs(g), initial=0.0))
+    evaluations, accelerated = 1, 0
+    dX, dG = [], []
+    ratios, accelerating = [math.inf, math.inf], False
+    while res > tol and evaluations + 1 < max_evaluations:
+        x_new = fx
+        accelerating = accelerating or (res < accelerate_below and abs(ratios[1] - ratios[0]) < RATE_SETTLED)
+        if accelerating and dG:
+            Gm, Xm = np.stack(dG, axis=1), np.stack(dX, axis=1)
+            gamma = np.linalg.lstsq(Gm, g, rcond=None)[0]
+            x_new = x + g - (Xm + Gm) @ gamma
+        fx_new = F(x_new)
+        evaluations += 1
+        g_new = fx_new - x_new
+        if x_new is not fx:
+            if np.max(np.abs(g_new)) > SAFEGUARD_FACTOR * res:
+                # Extrapolation crossed a kink of F: restart the history from a plain step
+                dX.clear()
+                dG.clear()
+                x_new, fx_new = fx, F(fx)
+                evaluations += 1
+                g_new = fx_new - x_new
+                accelerating = False
+            else:
+                accelerated += 1
+        dX.append(x_new - x)
+        dG.append(g_new - g)
+        if len(dX) > memory:
+            dX.pop(0)
+            dG.pop(0)
+        x, fx, g = x_new, fx_new, g_new
+        new_res = float(np.max(np.abs(g), initial=0.0))
+        ratios = [ratios[1], new_res / res if res else 0.0]
+        res = new_res
+
+    # One plain step puts the answer back on valid TFNs (lo ≤ mid ≤ hi)
+    X = fx
+    r = F(X) - X
+    evaluations += 1
+    residual = float(np.max(np.abs(r), initial=0.0))
+    converged = res <= tol
+    q, v = contraction_bound(W, lam, clamp)
+    info = {"status": "fixed_point" if converged else "not_converged", "evaluations": evaluations,
+            "accelerated": accelerated, "residual": residual, "contraction": q, "unique": q < 1,
+            "error_bound": None}
+    if q < 1:
+        free = v > 0
+        r_v = np.max(np.abs(r.reshape(shape))[free].max(axis=1) / v[free], initial=0.0)
+        info["error_bound"] = float(r_v / (1 - q))
+    if certify and converged:
+        rate = local_rate(F, X, None if clamp is None else np.repeat(clamp, shape[1]))
+        if rate >= 1 and accelerated:
+            # Acceleration landed on a repelling fixed point that simulation moves away
+            # from; redo the solve with plain steps, which follow the simulated path
+            X, crisp, info = steady_state(W, X0, clamp, lam, tol, max_evaluations, accelerate_below=0)
+            info["evaluations"] += evaluations
+            return X, crisp, info
+        reached = True
+        if accelerated:
+            budget = min(VERIFY_STEPS, max(max_evaluations - evaluations, 0))
+            reached, used = _reaches(F, X0.ravel(), X, budget)
+            evaluations += used
+            if reached is False:
+                # Simulation settles on another attractor; plain steps follow it there
+                X, crisp, info = steady_state(W, X0, clamp, lam, tol, max_evaluations, accelerate_below=0)
+                info["evaluations"] += evaluations
+                return X, crisp, info
+        info.update(evaluations=evaluations, local_rate=rate, stable=rate < 1, reached=reached,
+                    predicted_steps=None)
+        if reached and 0 < rate < 1 and start_residual > tol:
+            info["predicted_steps"] = math.ceil(math.log(tol / start_residual) / math.log(rate))
+    X = X.reshape(shape)
+    return X, defuzzify_array(X), info
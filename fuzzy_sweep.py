@@ -0,0 +1,173 @@
+import itertools
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from fuzzy_engine import clamp_mask, defuzzify_array, fuzzy_multiply_array, fuzzy_multiply_sum
+from fuzzy_sparse import sparse_entries
+
+# Per-worker copies of the model, set once by the pool initializer
+_WORKER = {}
+# Default edge set of `edge_sensitivity`: at most this many existing edges, strongest |mid| first
+SENSITIVITY_MAX_EDGES = 2000
+
+
+def sweep_grid(lams, clamp_sets=((),), edges=(None,), deltas=(0.0,)):
+    """Full grid of sweep configurations.
+
+    Each configuration is a dict with `lam`, `clamp` (tuple of concept
+    names), `edge` ((source, target) names or None) and `delta`, the shift
+    added to all three components of that edge's TFN.
+    """
+    return [{"lam": float(lam), "clamp": tuple(clamp), "edge": edge, "delta": float(delta)}
+            for lam, clamp, edge, delta in itertools.product(lams, clamp_sets, edges, deltas)]
+
+
+def sweep_random(n_samples, lam_range=(0.1, 3.0), clamp_sets=((),), edges=(None,),
+                 delta_range=(0.0, 0.0), seed=None):
+    """Random sample of sweep configurations (λ and δ uniform, clamps and edges drawn)."""
+    rng = np.random.default_rng(seed)
+    return [{"lam": float(rng.uniform(*lam_range)),
+             "clamp": tuple(clamp_sets[rng.integers(len(clamp_sets))]),
+             "edge": edges[rng.integers(len(edges))],
+             "delta": float(rng.uniform(*delta_range))}
+            for _ in range(n_samples)]
+
+
+def _weights(W):
+    return W if hasattr(W, "indptr") else np.asarray(W, dtype=float)
+
+
+def _entries(W, i, j):
+    return sparse_entries(W, i, j) if hasattr(W, "indptr") else W[i, j]
+
+
+def _strongest_edges(W, limit):
+    """(i, j) of the off-diagonal non-zero edges, at most `limit` of them by largest |mid|."""
+    if hasattr(W, "indptr"):
+        i = np.repeat(np.arange(len(W.indptr) - 1), np.diff(W.indptr))
+        j, values = W.indices, W.values
+    else:
+        i, j = np.nonzero(np.any(W != 0.0, axis=2))
+        values = W[i, j]
+    keep = (i != j) & np.any(values != 0.0, axis=1)
+    i, j, mid = i[keep], j[keep], np.abs(values[keep, 1])
+    if len(i) > limit:
+        top = np.sort(np.argsort(-mid, kind="stable")[:limit])
+        i, j = i[top], j[top]
+    return i, j
+
+
+def simulate_configs(W, X0, lams, clamps, edges, deltas, iterations=15):
+    """Final centroids of B configurations run together against one W (dense or SparseWeights).
+
+    `edges` is a (B, 2) array of (i, j) indices (-1 for no perturbation).
+    A perturbed edge only changes row i of the pre-activation sum, so each
+    step swaps that one product instead of rebuilding W per configuration;
+    this also perturbs edges a sparse W does not store.
+    """
+    B = len(lams)
+    X0 = np.broadcast_to(X0, (B,) + X0.shape)
+    lam = np.asarray(lams, dtype=float)[:, None, None]
+    clamps = np.asarray(clamps, dtype=bool)
+    b = np.flatnonzero(edges[:, 0] >= 0)
+    i, j = edges[b, 0], edges[b, 1]
+    old = _entries(W, i, j)
+    new = old + np.asarray(deltas, dtype=float)[b, None]
+    X = X0
+    for _ in range(iterations):
+        S = fuzzy_multiply_sum(W, X)
+        S[b, i] += fuzzy_multiply_array(new, X[b, j]) - fuzzy_multiply_array(old, X[b, j])
+        X = np.where(clamps[..., None], X0, np.tanh(lam * S))
+    return defuzzify_array(X)
+
+
+def _init_worker(W, X0, iterations):
+    _WORKER.update(W=W, X0=X0, iterations=iterations)
+
+
+def _run_chunk(chunk):
+    return simulate_configs(_WORKER["W"], _WORKER["X0"], *chunk, iterations=_WORKER["iterations"])
+
+
+def _encode(configs, names):
+    """Turn config dicts into the arrays `simulate_configs` takes."""
+    index = {c: k for k, c in enumerate(names)}
+    lams = np.array([c["lam"] for c in configs], dtype=float)
+    clamps = np.array([clamp_mask(names, c["clamp"]) for c in configs], dtype=bool).reshape(-1, len(names))
+    edges = np.array([(index[c["edge"][0]], index[c["edge"][1]]) if c["edge"] else (-1, -1)
+                      for c in configs], dtype=np.int64).reshape(-1, 2)
+    if (edges[:, 0] == edges[:, 1])[edges[:, 0] >= 0].any():
+        raise ValueError("Self-weights are fixed at (1, 1, 1) and cannot be perturbed.")
+    deltas = np.array([c["delta"] for c in configs], dtype=float)
+    return lams, clamps, edges, deltas
+
+
+def run_configs(W, X0, names, configs, iterations=15, processes=None, chunksize=None):
+    """Final centroids for every configuration as a (len(configs), n) array.
+
+    Configurations are split into chunks, each run as one batch; chunks are
+    spread across a process pool of `processes` workers (all local cores by
+    default). With `processes=1` everything runs in this process. A
+    `fuzzy_sparse.SparseWeights` W is passed to the workers as it is.
+    """
+    W = _weights(W)
+    X0 = np.asarray(X0, dtype=float)
+    arrays = _encode(configs, names)
+    if not configs:
+        return np.empty((0, len(names)))
+    processes = processes or os.cpu_count() or 1
+    chunksize = chunksize or max(1, math.ceil(len(configs) / (4 * processes)))
+    chunks = [tuple(a[k:k + chunksize] for a in arrays) for k in range(0, len(configs), chunksize)]
+    if processes == 1 or len(chunks) == 1:
+        results = [simulate_configs(W, X0, *c, iterations=iterations) for c in chunks]
+    else:
+        with ProcessPoolExecutor(processes, initializer=_init_worker,
+                                 initargs=(W, X0, iterations)) as pool:
+            results = list(pool.map(_run_chunk, chunks))
+    return np.concatenate(results)
+
+
+def run_sweep(W, X0, names, configs, iterations=15, processes=None, chunksize=None):
+    """Run a sweep and return a tidy table: one row per configuration with
+    its parameters and the final centroid of every concept."""
+    final = run_configs(W, X0, names, configs, iterations, processes, chunksize)
+    table = pd.DataFrame(configs, columns=["lam", "clamp", "edge", "delta"])
+    return pd.concat([table, pd.DataFrame(final, columns=names)], axis=1)
+
+
+def edge_sensitivity(W, X0, names, edges=None, step=0.01, lam=1.0, clamp_concepts=None,
+                     iterations=15, processes=None, chunksize=None, max_edges=SENSITIVITY_MAX_EDGES):
+    """One-at-a-time sensitivity of the final centroids to each edge weight.
+
+    Every edge in `edges` is shifted by `step` and the change in final
+    centroids is compared with the unperturbed run. Each edge costs a full
+    run of the map, O(E·nnz·T) for E edges, so screening all n² pairs of a
+    dense map is O(n⁴·T). By default only the existing non-zero edges are
+    screened, capped at `max_edges` (SENSITIVITY_MAX_EDGES) of them by
+    largest |mid|; pass `edges` to screen absent or other edges.
+    Returns two DataFrames indexed by (source, target) with one column per
+    concept: the sensitivities ΔC/Δw and the elasticities (ΔC/C)/(Δw/w),
+    using the edge's mid value as w (NaN where C or w is zero).
+    """
+    W = _weights(W)
+    if edges is None:
+        i, j = _strongest_edges(W, max_edges)
+        edges = [(names[u], names[v]) for u, v in zip(i.tolist(), j.tolist())]
+    clamp = tuple(clamp_concepts or ())
+    configs = [{"lam": lam, "clamp": clamp, "edge": None, "delta": 0.0}]
+    configs += [{"lam": lam, "clamp": clamp, "edge": e, "delta": step} for e in edges]
+    final = run_configs(W, X0, names, configs, iterations, processes, chunksize)
+    base, pert = final[0], final[1:]
+    sens = (pert - base) / step
+    index = {c: k for k, c in enumerate(names)}
+    pairs = np.array([(index[u], index[v]) for u, v in edges], dtype=np.int64).reshape(-1, 2)
+    w = _entries(W, pairs[:, 0], pairs[:, 1])[:, 1:2]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        elast = np.where((base != 0) & (w != 0), sens * w / base, np.nan)
+    rows = pd.MultiIndex.from_tuples(edges, names=["source", "target"])
+    return (pd.DataFrame(sens, index=rows, columns=names),
+            pd.DataFrame(elast, index=rows, columns=names))
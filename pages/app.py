@@ -5,69 +5,366 @@ import numpy as np
 import networkx as nx
 import plotly.graph_objects as go
 from io import BytesIO
-import tempfile
+import json
 
-from fuzzy_pipeline import fuzzy_pipeline, parse_interval
+import fuzzy_profile
+from fuzzy_cache import StageCache, make_key
+from fuzzy_io import load_model_bytes
+from fuzzy_engine import clamp_mask
+from fuzzy_jobs import JobQueue
+from fuzzy_metrics import WEIGHT_MODES, edge_arrays, graph_metrics
+from fuzzy_montecarlo import monte_carlo
+from fuzzy_steady import steady_state
 from plot_fuzzy_3D_triangle_evolution import plot_fuzzy_triangle_evolution_with_centroids
 
 st.set_page_config(page_title='Generalised FCM Simulator', layout='wide')
 st.title('Generalised Fuzzy Cognitive Maps Simulator')
 
+# Update evaluations allowed for the steady-state preview, and its tolerance
+PREVIEW_MAX_EVALUATIONS = 300
+PREVIEW_TOL = 1e-6
+# The preview runs in the script thread; above this many concepts it starts switched off
+PREVIEW_DEFAULT_MAX_N = 300
+
+# Polling fragments (st.experimental_fragment before Streamlit 1.37)
+fragment = getattr(st, 'fragment', None) or st.experimental_fragment
+
+
+@st.cache_resource
+def stage_cache():
+    # One memory-bounded LRU shared by all sessions; keys are content hashes
+    return StageCache()
+
+
+@st.cache_resource
+def job_queue():
+    # Background worker threads shared by all sessions
+    return JobQueue(max_workers=2)
+
+
+def load_results(result, params):
+    fuzzy_hist, crisp_hist, conv_info = result
+    st.session_state.run_sim = True
+    st.session_state.sim_key = params['sim_key']
+    st.session_state.model_hash = params['model_hash']
+    st.session_state.conv_info = conv_info
+    st.session_state.fuzzy_hist = fuzzy_hist
+    st.session_state.crisp_hist = crisp_hist
+    st.session_state.names = params['names']
+    st.session_state.run_params = {'lam': params['lam'], 'clamp': params['mask']}
+    st.session_state.mc_request = None
+
+
+def job_panel_body():
+    session_jobs = [j for j in map(jobs.get, st.session_state.get('job_ids', [])) if j]
+    if not session_jobs:
+        return
+    st.subheader('Simulation Jobs')
+    for job in reversed(session_jobs):
+        col_label, col_bar, col_btn = st.columns([3, 4, 1])
+        col_label.write(f"#{job.id} · {job.params['label']} · **{job.status}**")
+        col_bar.progress(job.progress)
+        if not job.done and col_btn.button('Cancel', key=f'cancel_{job.id}'):
+            job.cancel()
+        if job.status == 'failed':
+            st.error(f'Job #{job.id} failed: {job.error}')
+        if job.status == 'running' and job.steps_done >= 0:
+            shown = job.params['names'][:10]
+            st.line_chart(pd.DataFrame(job.partial_centroids()[:, :len(shown)], columns=shown))
+    loaded = st.session_state.setdefault('loaded_jobs', set())
+    for job in session_jobs:
+        if job.status == 'done' and job.id not in loaded:
+            loaded.add(job.id)
+            cache.put('simulate', job.params['sim_key'], job.result)
+            load_results(job.result, job.params)
+    if any(j.done for j in session_jobs) and st.button('Clear finished jobs'):
+        for job in session_jobs:
+            if job.done:
+                jobs.forget(job.id)
+        st.session_state.job_ids = [j.id for j in session_jobs if not j.done]
+        st.rerun()
+
+
+# Re-runs itself every second while a job is active; a full rerun renders finished results
+@fragment(run_every=1.0)
+def live_job_panel():
+    job_panel_body()
+    session_jobs = [j for j in map(jobs.get, st.session_state.get('job_ids', [])) if j]
+    if all(j.done for j in session_jobs):
+        st.rerun()
+
+
+def steady_state_panel(preview, names):
+    X, centroids, info = preview
+    with st.expander('Steady-state preview', expanded=not st.session_state.get('run_sim')):
+        if info['status'] != 'fixed_point':
+            st.warning(f"No fixed point within {info['evaluations']} update evaluations; the map may cycle "
+                       "or settle slowly. Run the full simulation.")
+        elif not info['stable']:
+            st.warning('This fixed point is unstable: simulation will move away from it.')
+        elif info['reached'] is None:
+            st.info(f"Found a fixed point with {info['evaluations']} update evaluations, but a short check "
+                    "could not confirm that simulation from the initial state ends there; the map may have "
+                    "other attractors. Run the full simulation to see where it goes.")
+        else:
+            steps = info['predicted_steps']
+            st.success(f"Simulation from the initial state settles here (found with {info['evaluations']} "
+                       "update evaluations" + (f"; plain iteration needs about {steps} steps)." if steps else ').'))
+        certificate = f"Residual {info['residual']:.1e}. Contraction bound {info['contraction']:.3f}"
+        if info['unique']:
+            certificate += f" < 1: the fixed point is unique and within {info['error_bound']:.1e} of this state."
+        else:
+            certificate += ' ≥ 1: other fixed points or cycles may exist.'
+        st.caption(certificate)
+        df_pre = pd.DataFrame(X, index=names, columns=['lo', 'mid', 'hi']).assign(centroid=centroids)
+        st.dataframe(df_pre.style.format(precision=4))
+
+
+def network_graph(W, names):
+    rows, cols, vals = edge_arrays(W)
+    G = nx.DiGraph()
+    G.add_nodes_from(names)
+    G.add_weighted_edges_from((names[i], names[j], w) for i, j, w in zip(rows, cols, vals[:, 1]))
+    return G
+
+
+def network_layout(G, layout_option):
+    if layout_option == 'hierarchical':
+        try:
+            return nx.nx_agraph.graphviz_layout(G, prog='dot'), None
+        except:
+            return nx.spring_layout(G), 'Install pygraphviz or pydot for hierarchical layouts.'
+    return getattr(nx, f"{layout_option}_layout")(G), None
+
+
+def network_figure(G, pos, X0):
+    I_vals = dict(zip(G.nodes(), X0.tolist()))
+    edge_x, edge_y, edge_annotations = [], [], []
+    for u,v,data in G.edges(data=True):
+        x0,y0 = pos[u]; x1,y1 = pos[v]
+        edge_x += [x0, x1, None]; edge_y += [y0, y1, None]
+        edge_annotations.append(dict(ax=x0, ay=y0, axref='x', ayref='y',
+                                  x=x1, y=y1, xref='x', yref='y',
+                                  showarrow=True, arrowhead=3,
+                                  arrowsize=1, arrowwidth=1, arrowcolor='grey'))
+    node_x = [pos[n][0] for n in G.nodes()]; node_y = [pos[n][1] for n in G.nodes()]
+    node_text = [f"{n}<br>I={I_vals[n]}" for n in G.nodes()]
+
+    fig_net = go.Figure()
+    fig_net.add_trace(go.Scatter(x=edge_x, y=edge_y, mode='lines', line=dict(color='grey'), hoverinfo='none'))
+    fig_net.add_trace(go.Scatter(
+        x=node_x, y=node_y, mode='markers+text',
+        marker=dict(size=20, color='skyblue'),
+        text=list(G.nodes()), textposition='top center',
+        hovertext=node_text, hoverinfo='text'
+    ))
+    fig_net.update_layout(
+        title='FCM Directed Network',
+        showlegend=False,
+        annotations=edge_annotations,
+        xaxis=dict(showgrid=False, zeroline=False, visible=False),
+        yaxis=dict(showgrid=False, zeroline=False, visible=False),
+        margin=dict(t=30, b=0, l=0, r=0)
+    )
+    return fig_net
+
+
+def centroid_figure(crisp_hist, names, sel, bands):
+    fig2 = go.Figure()
+    steps = list(range(len(crisp_hist)))
+    for c in sel:
+        idx = names.index(c)
+        if bands:
+            q_lo, q_hi = min(bands['quantiles']), max(bands['quantiles'])
+            fig2.add_trace(go.Scatter(
+                x=steps, y=bands['quantiles'][q_hi][:, idx],
+                mode='lines', line=dict(width=0), showlegend=False, hoverinfo='skip'
+            ))
+            fig2.add_trace(go.Scatter(
+                x=steps, y=bands['quantiles'][q_lo][:, idx],
+                mode='lines', line=dict(width=0), fill='tonexty',
+                name=f'{c} {q_lo:.0%}–{q_hi:.0%}', hoverinfo='skip'
+            ))
+        fig2.add_trace(go.Scatter(
+            x=steps,
+            y=crisp_hist[:, idx],
+            mode='lines+markers',
+            name=c
+        ))
+    fig2.update_layout(
+        title='Centroid Trajectories',
+        xaxis_title='Iteration',
+        yaxis_title='Centroid Value',
+        legend_title='Concept'
+    )
+    return fig2
+
+
+def figure_3d(fuzzy_hist, names, selected_3d, plot_every, max_points):
+    # Per-concept (steps, 3) slices of the fuzzy history, selected concepts only
+    filtered_data = {c: fuzzy_hist[:, names.index(c)] for c in selected_3d}
+
+    # Generate the 3D triangle evolution plot
+    fig3d = plot_fuzzy_triangle_evolution_with_centroids(
+        filtered_data,
+        iterations=len(fuzzy_hist),
+        every=plot_every,
+        max_points=max_points or None
+    )
+    # Correct axes and titles
+    fig3d.update_layout(
+        title='3D Fuzzy Triangle Evolution',
+        scene=dict(
+            xaxis_title='Value',
+            yaxis_title='Iteration',
+            zaxis_title='Height',
+            xaxis=dict(range=[-1, 1]),
+            yaxis=dict(range=[0, len(fuzzy_hist)]),
+            zaxis=dict(range=[0, 1]),
+        ),
+        margin=dict(l=0, r=0, t=30, b=0)
+    )
+    return fig3d
+
+
+def figure_png(fig):
+    # None when Kaleido is unavailable
+    try:
+        buf = BytesIO()
+        fig.write_image(buf, format='png')
+        return buf.getvalue()
+    except Exception:
+        return None
+
+
+def diagnostics_panel():
+    with st.expander('Diagnostics'):
+        if fuzzy_profile.attached() is None:
+            st.caption('Turn on "Record stage timings" in the sidebar to profile the app.')
+        df_prof = fuzzy_profile.report_frame(profile)
+        if not df_prof.empty:
+            st.caption('Stage timings cover this session only; cache hits cost nothing and are not listed.')
+            shown = df_prof.assign(
+                total_ms=df_prof['total_s'] * 1e3, mean_ms=df_prof['mean_s'] * 1e3, max_ms=df_prof['max_s'] * 1e3,
+                peak_alloc_mb=df_prof['alloc_peak_bytes'] / 1024 ** 2, net_alloc_mb=df_prof['alloc_net_bytes'] / 1024 ** 2
+            )[['depth', 'calls', 'total_ms', 'mean_ms', 'max_ms', 'peak_alloc_mb', 'net_alloc_mb']]
+            st.dataframe(shown.style.format(precision=2))
+            st.download_button('Download Profile JSON', json.dumps(fuzzy_profile.report(profile), indent=2),
+                               'profile.json', mime='application/json')
+        stats = cache.stats()
+        st.write(f"Stage cache: {stats['entries']} entries, {stats['nbytes'] / 1024 ** 2:.1f} MB, "
+                 f"{stats['hits']} hits, {stats['misses']} misses")
+        if st.button('Reset timings'):
+            fuzzy_profile.reset(profile)
+            st.rerun()
+
+
+cache = stage_cache()
+jobs = job_queue()
+
+# Opt-in instrumentation of this session's script and job threads; off by
+# default so stages cost a flag check, and other sessions are never affected
+st.sidebar.header('Diagnostics')
+profile = st.session_state.setdefault('profile', fuzzy_profile.Session())
+profile_on = st.sidebar.checkbox('Record stage timings', value=False)
+trace_memory = st.sidebar.checkbox('Trace allocations (slower)', disabled=not profile_on)
+fuzzy_profile.set_session_memory(profile, profile_on and trace_memory)
+fuzzy_profile.attach(profile if profile_on else None)
+
 # Sidebar inputs
 st.sidebar.header('Upload Data')
-W_file = st.sidebar.file_uploader('Upload W matrix (CSV or XLSX)', type=['csv','xlsx'])
+W_file = st.sidebar.file_uploader('Upload W matrix (CSV or XLSX) or GFCM model (NPZ)', type=['csv','xlsx','npz'])
 I_file = st.sidebar.file_uploader('Upload I vector (CSV or XLSX)', type=['csv','xlsx'])
 
-if W_file and I_file:
+if W_file and (I_file or W_file.name.endswith('.npz')):
     try:
-        W_df = (pd.read_csv(W_file, index_col=0)
-                if W_file.name.endswith('.csv') else
-                pd.read_excel(W_file, index_col=0))
-        I_df = (pd.read_csv(I_file, index_col=0)
-                if I_file.name.endswith('.csv') else
-                pd.read_excel(I_file, index_col=0))
+        model = load_model_bytes(
+            W_file.getvalue(), W_file.name,
+            I_file.getvalue() if I_file else None, I_file.name if I_file else None,
+            cache=st.session_state.setdefault('model_cache', {})
+        )
+    except ValueError as e:
+        st.error(f'🔴 {e}')
+        st.stop()
     except Exception as e:
         st.error(f'Error reading files: {e}')
         st.stop()
 
-    concepts = list(W_df.index)
-    if list(W_df.columns) != concepts:
-        st.error('🔴 W rows and columns must have identical labels.')
-        st.stop()
-
-    if I_df.shape[1] == 1 and list(I_df.index) == concepts:
-        I_df = I_df.T
-    if list(I_df.columns) != concepts:
-        st.error('🔴 I vector must have same concept names as W columns.')
-        st.stop()
+    concepts = model['names']
+    W, X0 = model['W'], model['I']
 
     # Simulation controls
     st.sidebar.header('Simulation Parameters')
     lam = st.sidebar.slider('λ (steepness)', 0.1, 3.0, 1.0, 0.1)
     iterations = st.sidebar.slider('Iterations', 1, 100, 15, 1)
     clamp_concepts = st.sidebar.multiselect('Clamp Concepts', concepts)
+    stop_early = st.sidebar.checkbox('Stop at fixed point / limit cycle', value=True)
+    tol = st.sidebar.number_input('Convergence tolerance', 0.0, 1.0, 1e-6, format='%.1e',
+                                  disabled=not stop_early)
+    metric_weight = st.sidebar.selectbox(
+        'Centrality path weights', WEIGHT_MODES,
+        format_func=lambda w: 'hop count' if w is None else f'1/|{w}|'
+    )
+    metric_eps = st.sidebar.number_input(
+        'Centrality error budget ε (0 = exact)', 0.0, 0.5, 0.0 if len(concepts) <= 2000 else 0.05,
+        step=0.01, format='%.2f'
+    )
     layout_option = st.sidebar.selectbox(
         'Network Layout',
         ['spring','circular','shell','kamada_kawai','spectral','hierarchical']
     )
+    show_preview = st.sidebar.checkbox(
+        'Steady-state preview', value=len(concepts) <= PREVIEW_DEFAULT_MAX_N,
+        help=None if len(concepts) <= PREVIEW_DEFAULT_MAX_N else 'Off by default for large maps: it blocks the page while it runs.'
+    )
 
-    if st.sidebar.button('Run Simulation'):
-        fuzzy_hist, crisp_hist, names = fuzzy_pipeline(
-            W_df, I_df,
-            clamp_concepts=clamp_concepts,
-            lam=lam,
-            iterations=iterations
+    if show_preview:
+        preview = cache.get(
+            'steady_state', make_key(model['hash'], lam, sorted(clamp_concepts)),
+            lambda: steady_state(W, X0, clamp_mask(concepts, clamp_concepts), lam, tol=PREVIEW_TOL,
+                                 max_evaluations=PREVIEW_MAX_EVALUATIONS)
         )
-        st.session_state.run_sim = True
-        st.session_state.fuzzy_hist = fuzzy_hist
-        st.session_state.crisp_hist = crisp_hist
-        st.session_state.names = names
+        steady_state_panel(preview, concepts)
+
+    if st.sidebar.button('Run Simulation'):
+        params = {
+            'sim_key': make_key(model['hash'], lam, sorted(clamp_concepts), iterations, stop_early, tol),
+            'model_hash': model['hash'],
+            'names': concepts,
+            'mask': clamp_mask(concepts, clamp_concepts),
+            'label': f"λ={lam}, {iterations} iterations, clamped: {', '.join(map(str, clamp_concepts)) or 'none'}",
+        }
+        cached = cache.lookup('simulate', params['sim_key'])
+        if cached is not None:
+            load_results(cached, dict(params, lam=lam))
+        else:
+            job = jobs.submit(W, X0, params['mask'], lam, iterations, stop_early, tol, **params)
+            st.session_state.setdefault('job_ids', []).append(job.id)
+
+    session_jobs = [j for j in map(jobs.get, st.session_state.get('job_ids', [])) if j]
+    if any(not j.done for j in session_jobs):
+        live_job_panel()
+    else:
+        job_panel_body()
+
+    if st.session_state.get('run_sim') and st.session_state.get('model_hash') != model['hash']:
+        st.info('The uploaded model changed — run the simulation again.')
+    elif st.session_state.get('run_sim'):
+        sim_key = st.session_state.sim_key
+        names = st.session_state.names
+        conv_info = st.session_state.get('conv_info')
+        if conv_info:
+            if conv_info['status'] == 'fixed_point':
+                st.success(f"Reached a fixed point at step {conv_info['step']}.")
+            elif conv_info['status'] == 'cycle':
+                st.info(f"Entered a period-{conv_info['period']} limit cycle at step {conv_info['step']}.")
+            else:
+                st.warning(f"No convergence within {conv_info['step']} steps.")
 
-    if st.session_state.get('run_sim'):
         # Centroid Table
         df_cent = pd.DataFrame(
             np.stack(st.session_state.crisp_hist),
-            columns=st.session_state.names
+            columns=names
         )
         df_cent.index.name = 'Iteration'
         st.subheader('Centroid Table')
@@ -80,54 +377,49 @@ if W_file and I_file:
 
         # 2D Centroid Evolution Charts
         st.subheader('Centroid Evolution (2D)')
-        sel = st.multiselect('Select concepts for 2D plot', st.session_state.names, default=st.session_state.names[:3])
+        sel = st.multiselect('Select concepts for 2D plot', names, default=names[:3])
+        with st.expander('Monte Carlo uncertainty bands'):
+            mc_samples = st.number_input('Samples of crisp W', 100, 100000, 1000, 100)
+            mc_range = st.slider('Percentile band', 0, 100, (5, 95))
+            if st.button('Compute bands'):
+                st.session_state.mc_request = (int(mc_samples), mc_range[0] / 100, mc_range[1] / 100)
+        mc_request = st.session_state.get('mc_request')
+        bands = None
+        if mc_request:
+            bands = cache.get('monte_carlo', make_key(sim_key, mc_request), lambda: monte_carlo(
+                W, X0,
+                iterations=len(st.session_state.crisp_hist) - 1,
+                n_samples=mc_request[0],
+                quantiles=mc_request[1:],
+                seed=0,
+                **st.session_state.run_params
+            ))
         if sel:
-            fig2 = go.Figure()
-            for c in sel:
-                idx = st.session_state.names.index(c)
-                fig2.add_trace(go.Scatter(
-                    x=list(range(len(st.session_state.crisp_hist))),
-                    y=[v[idx] for v in st.session_state.crisp_hist],
-                    mode='lines+markers',
-                    name=c
-                ))
-            fig2.update_layout(
-                title='Centroid Trajectories',
-                xaxis_title='Iteration',
-                yaxis_title='Centroid Value',
-                legend_title='Concept'
-            )
+            fig2_key = make_key(sim_key, sel, mc_request)
+            fig2 = cache.get('centroid_figure', fig2_key, lambda: centroid_figure(
+                np.asarray(st.session_state.crisp_hist), names, sel, bands))
             st.plotly_chart(fig2, use_container_width=True)
-            buf2 = BytesIO()
-            try:
-                fig2.write_image(buf2, format='png')
+            png2 = cache.get('centroid_png', fig2_key, lambda: figure_png(fig2))
+            if png2 is not None:
                 st.download_button(
                     'Download 2D Centroid Plot',
-                    buf2.getvalue(),
+                    png2,
                     'centroid_2d.png',
                     'image/png'
                 )
-            except:
+            else:
                 st.warning('⚠️ Install Kaleido for 2D image export: `pip install --upgrade kaleido`')
 
         # Graph Theoretical Indices
         st.subheader('Graph Theoretical Indices')
-        G = nx.DiGraph()
-        G.add_nodes_from(st.session_state.names)
-        for i,u in enumerate(st.session_state.names):
-            for j,v in enumerate(st.session_state.names):
-                lo, mid, hi = parse_interval(str(W_df.iloc[i,j]))
-                if not (lo==0 and mid==0 and hi==0):
-                    G.add_edge(u, v, weight=mid)
-        metrics = {
-            'Degree Centrality': nx.degree_centrality(G),
-            'In-Degree': dict(G.in_degree()),
-            'Out-Degree': dict(G.out_degree()),
-            'Betweenness': nx.betweenness_centrality(G),
-            'Closeness': nx.closeness_centrality(G)
-        }
-        df_metrics = pd.DataFrame(metrics)
-        df_metrics.index.name = 'Concept'
+        G = cache.get('network_graph', model['hash'], lambda: network_graph(W, names))
+        df_metrics = cache.get(
+            'graph_metrics', make_key(model['hash'], metric_weight, metric_eps),
+            lambda: graph_metrics(W, names, weight=metric_weight, epsilon=metric_eps or None, seed=0)
+        )
+        if not df_metrics.attrs['exact']:
+            st.caption(f"Betweenness and closeness estimated from {df_metrics.attrs['sources']} "
+                       f"sampled sources (±{metric_eps} with 90% confidence).")
         st.dataframe(df_metrics)
         st.download_button(
             'Download Graph Metrics CSV',
@@ -137,103 +429,49 @@ if W_file and I_file:
 
         # Network Visualization
         st.subheader('W-Network Visualization')
-        for n,val in zip(st.session_state.names, I_df.values.tolist()[0]):
-            G.nodes[n]['I'] = val
-        if layout_option == 'hierarchical':
-            try:
-                pos = nx.nx_agraph.graphviz_layout(G, prog='dot')
-            except:
-                st.warning('Install pygraphviz or pydot for hierarchical layouts.')
-                pos = nx.spring_layout(G)
-        else:
-            pos = getattr(nx, f"{layout_option}_layout")(G)
-
-        edge_x, edge_y, edge_annotations = [], [], []
-        for u,v,data in G.edges(data=True):
-            x0,y0 = pos[u]; x1,y1 = pos[v]
-            edge_x += [x0, x1, None]; edge_y += [y0, y1, None]
-            edge_annotations.append(dict(ax=x0, ay=y0, axref='x', ayref='y',
-                                      x=x1, y=y1, xref='x', yref='y',
-                                      showarrow=True, arrowhead=3,
-                                      arrowsize=1, arrowwidth=1, arrowcolor='grey'))
-        node_x = [pos[n][0] for n in G.nodes()]; node_y = [pos[n][1] for n in G.nodes()]
-        node_text = [f"{n}<br>I={G.nodes[n]['I']}" for n in G.nodes()]
-
-        fig_net = go.Figure()
-        fig_net.add_trace(go.Scatter(x=edge_x, y=edge_y, mode='lines', line=dict(color='grey'), hoverinfo='none'))
-        fig_net.add_trace(go.Scatter(
-            x=node_x, y=node_y, mode='markers+text',
-            marker=dict(size=20, color='skyblue'),
-            text=list(G.nodes()), textposition='top center',
-            hovertext=node_text, hoverinfo='text'
-        ))
-        fig_net.update_layout(
-            title='FCM Directed Network',
-            showlegend=False,
-            annotations=edge_annotations,
-            xaxis=dict(showgrid=False, zeroline=False, visible=False),
-            yaxis=dict(showgrid=False, zeroline=False, visible=False),
-            margin=dict(t=30, b=0, l=0, r=0)
-        )
+        layout_key = make_key(model['hash'], layout_option)
+        pos, layout_warning = cache.get('layout', layout_key, lambda: network_layout(G, layout_option))
+        if layout_warning:
+            st.warning(layout_warning)
+        fig_net = cache.get('network_figure', layout_key, lambda: network_figure(G, pos, X0))
         st.plotly_chart(fig_net, use_container_width=True)
 
         # 3D Fuzzy Triangle Evolution (replaced)
         st.subheader('3D Fuzzy Triangle Evolution')
         selected_3d = st.multiselect(
             'Select Concept(s) for 3D Evolution',
-            st.session_state.names,
-            default=st.session_state.names
+            names,
+            default=names
         )
 
-        # Prepare data per concept
-        fuzzy_data_stack = {c: [] for c in st.session_state.names}
-        for step in st.session_state.fuzzy_hist:
-            for i, c in enumerate(st.session_state.names):
-                fuzzy_data_stack[c].append(step[i])
-
-        # Filter to only selected concepts
-        filtered_data = {c: fuzzy_data_stack[c] for c in selected_3d}
+        col_every, col_cap = st.columns(2)
+        plot_every = col_every.number_input('Plot every k-th iteration', 1, 1000, 1, 1)
+        max_points = col_cap.number_input('Max points on screen (0 = no cap)', 0, 10_000_000, 200_000, 10_000)
 
-        # Generate and display the 3D triangle evolution plot
-        fig3d = plot_fuzzy_triangle_evolution_with_centroids(
-            filtered_data,
-            iterations=len(st.session_state.fuzzy_hist)
-        )
-        # Correct axes and titles
-        fig3d.update_layout(
-            title='3D Fuzzy Triangle Evolution',
-            scene=dict(
-                xaxis_title='Value',
-                yaxis_title='Iteration',
-                zaxis_title='Height',
-                xaxis=dict(range=[-1, 1]),
-                yaxis=dict(range=[0, len(st.session_state.fuzzy_hist)]),
-                zaxis=dict(range=[0, 1]),
-            ),
-            margin=dict(l=0, r=0, t=30, b=0)
-        )
+        fig3d_key = make_key(sim_key, selected_3d, plot_every, max_points)
+        fig3d = cache.get('figure_3d', fig3d_key, lambda: figure_3d(
+            np.asarray(st.session_state.fuzzy_hist), names, selected_3d, plot_every, max_points))
         st.plotly_chart(fig3d, use_container_width=True)
 
         # Export 3D plot as HTML
-        buf_html = tempfile.NamedTemporaryFile(delete=False, suffix='.html')
-        fig3d.write_html(buf_html.name)
-        with open(buf_html.name, "rb") as fp:
-            st.download_button(
-                'Download 3D Plot as HTML',
-                fp,
-                file_name='fuzzy_3d_plot.html',
-                mime='text/html'
-            )
+        html3d = cache.get('figure_3d_html', fig3d_key, lambda: fig3d.to_html().encode())
+        st.download_button(
+            'Download 3D Plot as HTML',
+            html3d,
+            file_name='fuzzy_3d_plot.html',
+            mime='text/html'
+        )
 
         # Export 3D plot as PNG image
-        try:
-            buf_png = BytesIO()
-            fig3d.write_image(buf_png, format='png')
+        png3d = cache.get('figure_3d_png', fig3d_key, lambda: figure_png(fig3d))
+        if png3d is not None:
             st.download_button(
                 'Download 3D Plot as PNG',
-                buf_png.getvalue(),
+                png3d,
                 file_name='fuzzy_3d_plot.png',
                 mime='image/png'
             )
-        except Exception:
+        else:
             st.warning('⚠️ Install Kaleido for 3D image export: `pip install --upgrade kaleido`')
+
+diagnostics_panel()
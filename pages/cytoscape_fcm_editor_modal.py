@@ -1,10 +1,16 @@
 import streamlit as st
 import pandas as pd
-import json
 from io import BytesIO
 import streamlit.components.v1 as components
 from pathlib import Path
 
+from fuzzy_io import save_model, weight_matrix_rows, write_edge_list, write_weight_matrix
+from fuzzy_sparse import (graph_edge_arrays, graph_from_elements, iter_graph_elements, sparse_to_dense,
+                          sparse_weights_from_graph)
+
+# Largest map whose W matrix and .npz model are built in memory as downloads
+MATRIX_DOWNLOAD_MAX_N = 500
+
 st.set_page_config(layout="wide", initial_sidebar_state="collapsed")
 st.title("🧠 Generalised Fuzzy Cognitive Map Builder")
 
@@ -15,49 +21,18 @@ st.markdown("---")
 # --- Single uploader in Streamlit ---
 uploaded = st.file_uploader("📥 Upload your graph (JSON or GFCM)", type=["json", "gfcm"])
 
-def normalise(data):
-    """Return flat list of {group:'nodes'|'edges', data:{...}}"""
-    if isinstance(data, dict):
-        if "elements" in data:
-            out = []
-            for g in ("nodes", "edges"):
-                out += [{"group": g, "data": d.get("data", d)} for d in data["elements"].get(g, [])]
-            return out
-        if "nodes" in data and "edges" in data:
-            return ([{"group": "nodes", "data": d.get("data", d)} for d in data["nodes"]] +
-                    [{"group": "edges", "data": d.get("data", d)} for d in data["edges"]])
-        return []
-    return data if isinstance(data, list) else []
-
 if uploaded:
     try:
-        raw = uploaded.read()
-        data = json.loads(raw.decode("utf-8") if isinstance(raw, (bytes, bytearray)) else raw)
-        elems = normalise(data)
-        if not elems:
+        # Streamed element by element: memory follows the edge count, not n²
+        graph = graph_from_elements(iter_graph_elements(uploaded))
+        if not graph.names and not graph.edges:
             st.error("⚠️ Could not recognise JSON structure.")
             st.stop()
 
-        nodes = []
-        edges = []
-        for el in elems:
-            grp = el.get("group")
-            d = el.get("data", {})
-            if grp == "nodes":
-                nodes.append({
-                    "id": str(d.get("id", "")),
-                    "label": d.get("label", str(d.get("id", ""))),
-                    "tfn": d.get("tfn", "0.0,0.0,0.0")
-                })
-            elif grp == "edges":
-                edges.append({
-                    "source": str(d.get("source", "")),
-                    "target": str(d.get("target", "")),
-                    "tfn": d.get("tfn", "0.0,0.0,0.0")
-                })
-
-        labels = [n["label"] for n in nodes]
-        tfns   = [f"[{n['tfn']}]" for n in nodes]
+        labels = graph.names
+        tfns   = [f"[{t}]" for t in graph.tfns]
+        cells  = {ij: f"[{t}]" for ij, t in graph.edges.items()}
+        size   = len(labels)
 
         # --- Matrix I: 1 x n, blank row 2 first cell ---
         df_I = pd.DataFrame([
@@ -65,39 +40,46 @@ if uploaded:
             [""] + tfns
         ])
 
-        # --- Matrix W: n x n ---
-        id_map = {n["id"]: i for i, n in enumerate(nodes)}
-        size = len(nodes)
-        mat = [["[0.0,0.0,0.0]"] * size for _ in range(size)]
-        for e in edges:
-            i = id_map.get(e["source"])
-            j = id_map.get(e["target"])
-            if i is not None and j is not None:
-                mat[i][j] = f"[{e['tfn']}]"
-        df_W = pd.DataFrame(mat, index=labels, columns=labels)
-        df_W.index.name = ""
-
         st.subheader("📊 Export Matrices")
+        st.caption(f"{size} concepts, {len(cells)} edges")
 
-        # --- Excel downloads ---
+        # --- Matrix I downloads ---
         bufI = BytesIO()
         with pd.ExcelWriter(bufI, engine="openpyxl") as w:
             df_I.to_excel(w, sheet_name="Matrix_I", index=False, header=False)
         bufI.seek(0)
         st.download_button("Download Matrix I (.xlsx)", bufI, file_name="Matrix_I.xlsx")
 
-        bufW = BytesIO()
-        with pd.ExcelWriter(bufW, engine="openpyxl") as w:
-            df_W.to_excel(w, sheet_name="Matrix_W")
-        bufW.seek(0)
-        st.download_button("Download Matrix W (.xlsx)", bufW, file_name="Matrix_W.xlsx")
-
-        # --- Separate CSV downloads ---
         csvI = df_I.to_csv(index=False, header=False)
         st.download_button("Download Matrix I (.csv)", csvI, file_name="Matrix_I.csv", mime="text/csv")
 
-        csvW = df_W.to_csv()
-        st.download_button("Download Matrix W (.csv)", csvW, file_name="Matrix_W.csv", mime="text/csv")
+        # --- Edge list: one row per edge, readable by fuzzy_sparse.read_edge_list ---
+        bufE = BytesIO()
+        write_edge_list(bufE, labels, *graph_edge_arrays(graph))
+        st.download_button("Download Edge List (.csv)", bufE.getvalue(), file_name="Edge_list.csv", mime="text/csv")
+
+        if size <= MATRIX_DOWNLOAD_MAX_N:
+            # --- Matrix W: n x n, written row by row ---
+            bufW = BytesIO()
+            write_weight_matrix(bufW, labels, weight_matrix_rows(size, cells), fmt="xlsx")
+            st.download_button("Download Matrix W (.xlsx)", bufW.getvalue(), file_name="Matrix_W.xlsx")
+
+            bufWc = BytesIO()
+            write_weight_matrix(bufWc, labels, weight_matrix_rows(size, cells))
+            st.download_button("Download Matrix W (.csv)", bufWc.getvalue(), file_name="Matrix_W.csv",
+                               mime="text/csv")
+
+            # --- Binary GFCM model (W, I and concept names in one file) ---
+            model_names, Ws, X0 = sparse_weights_from_graph(graph)
+            bufM = BytesIO()
+            save_model(bufM, model_names, sparse_to_dense(Ws), X0, {"source": uploaded.name})
+            st.download_button("Download GFCM Model (.npz)", bufM.getvalue(), file_name="GFCM_model.npz")
+        else:
+            # --- Large maps: W is not built for the browser, whose download holds it in memory ---
+            st.info(f"Matrix W has {size}×{size} cells, too many to download through the browser. "
+                    "Download the edge list together with Matrix I instead: "
+                    "`fuzzy_sparse.read_edge_list` loads it as sparse weights, and "
+                    "`fuzzy_io.write_weight_matrix` streams W from it to a file row by row.")
 
     except Exception as e:
         st.error(f"❌ Parse error: {e}")
@@ -1,50 +1,60 @@
+import math
+
+import numpy as np
 import plotly.graph_objects as go
 
-def plot_fuzzy_triangle_evolution_with_centroids(fuzzy_data_stack, iterations=15):
-    fig = go.Figure()
-    concepts = list(fuzzy_data_stack.keys())
-    centroid_lines = {concept: {'x': [], 'y': [], 'z': []} for concept in concepts}
+from fuzzy_profile import profiled
 
-    for concept_idx, (concept, triples) in enumerate(fuzzy_data_stack.items()):
-        for t, (lo, mid, hi) in enumerate(triples):
-            y = t + 1
-            x = [lo, mid, hi]
-            y_fixed = [y, y, y]
-            z = [0, 1, 0]
+# Points drawn per iteration of one concept: closed triangle (4) + gap (1)
+POINTS_PER_TRIANGLE = 5
 
-            x_loop = x + [x[0]]
-            y_loop = y_fixed + [y_fixed[0]]
-            z_loop = z + [z[0]]
 
-            fig.add_trace(go.Scatter3d(
-                x=x_loop, y=y_loop, z=z_loop,
-                mode="lines",
-                line=dict(color="blue"),
-                name=f"{concept} Triangle" if t == 0 else None,
-                showlegend=(t == 0)
-            ))
+def decimation_stride(n_concepts, n_steps, every=1, max_points=None):
+    """Smallest stride ≥ `every` keeping the drawn points under `max_points`."""
+    every = max(1, int(every))
+    if max_points:
+        per_step = n_concepts * (POINTS_PER_TRIANGLE + 2)
+        every = max(every, math.ceil(n_steps * per_step / max_points))
+    return every
 
-            cx = (lo + mid + hi) / 3
-            cy = y
-            cz = 1 / 3
 
-            centroid_lines[concept]['x'].append(cx)
-            centroid_lines[concept]['y'].append(cy)
-            centroid_lines[concept]['z'].append(cz)
+@profiled("plot_triangles")
+def plot_fuzzy_triangle_evolution_with_centroids(fuzzy_data_stack, iterations=15, every=1, max_points=None):
+    fig = go.Figure()
+    if not fuzzy_data_stack:
+        return fig
+    n_steps = max(len(triples) for triples in fuzzy_data_stack.values())
+    stride = decimation_stride(len(fuzzy_data_stack), n_steps, every, max_points)
 
-            fig.add_trace(go.Scatter3d(
-                x=[cx], y=[cy], z=[cz],
-                mode="markers",
-                marker=dict(size=4, color="red", symbol="diamond"),
-                name=f"{concept} Centroid" if t == 0 else None,
-                showlegend=(t == 0)
-            ))
+    for concept, triples in fuzzy_data_stack.items():
+        tfn = np.asarray(triples, dtype=float).reshape(-1, 3)
+        # Every stride-th iteration, always keeping the last one
+        steps = np.unique(np.append(np.arange(0, len(tfn), stride), len(tfn) - 1))
+        tfn = tfn[steps]
+        y = steps + 1.0
 
-    for concept, coords in centroid_lines.items():
+        # All triangles of this concept in one trace, separated by NaN gaps
+        x_tri = np.column_stack([tfn, tfn[:, 0], np.full(len(tfn), np.nan)]).ravel()
+        y_tri = np.repeat(y, POINTS_PER_TRIANGLE)
+        z_tri = np.tile([0.0, 1.0, 0.0, 0.0, np.nan], len(tfn))
+        fig.add_trace(go.Scatter3d(
+            x=x_tri, y=y_tri, z=z_tri,
+            mode="lines",
+            line=dict(color="blue"),
+            name=f"{concept} Triangle",
+            connectgaps=False
+        ))
+
+        cx = tfn.sum(axis=1) / 3
+        cz = np.full(len(tfn), 1 / 3)
+        fig.add_trace(go.Scatter3d(
+            x=cx, y=y, z=cz,
+            mode="markers",
+            marker=dict(size=4, color="red", symbol="diamond"),
+            name=f"{concept} Centroid"
+        ))
         fig.add_trace(go.Scatter3d(
-            x=coords['x'],
-            y=coords['y'],
-            z=coords['z'],
+            x=cx, y=y, z=cz,
             mode="lines",
             line=dict(color="red", width=6),
             name=f"{concept} Centroid Path"
@@ -63,4 +73,4 @@ def plot_fuzzy_triangle_evolution_with_centroids(fuzzy_data_stack, iterations=15
         margin=dict(l=0, r=0, b=0, t=40)
     )
 
-    return fig
\ No newline at end of file
+    return fig
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import fuzzy_kernels
+from fuzzy_engine import resimulate, simulate, simulate_batch, simulate_cached
+from fuzzy_pipeline import fuzzy_pipeline
+from fuzzy_sparse import sparse_weights_from_dense
+
+SEEDS = range(4)
+ITERATIONS = 8
+
+
+def random_map(seed, n=9, density=0.4):
+    """Sparse random W with the unit diagonal, initial state and a one-concept clamp."""
+    rng = np.random.default_rng(seed)
+    W = np.sort(rng.uniform(-1, 1, (n, n, 3)), axis=-1) * (rng.random((n, n, 1)) < density)
+    W[np.arange(n), np.arange(n)] = 1.0
+    X0 = np.sort(rng.uniform(-1, 1, (n, 3)), axis=-1)
+    clamp = np.zeros(n, dtype=bool)
+    clamp[rng.integers(n)] = True
+    lam = float(rng.uniform(0.5, 2.0))
+    return W, X0, clamp, lam
+
+
+def cell(tfn):
+    return "[" + ",".join(repr(float(v)) for v in tfn) + "]"
+
+
+def reference(W, X0, clamp, lam):
+    """Fuzzy and crisp histories of `fuzzy_pipeline.fuzzy_pipeline` as arrays."""
+    names = [f"C{k}" for k in range(len(X0))]
+    W_df = pd.DataFrame([[cell(w) for w in row] for row in W], index=names, columns=names)
+    I_df = pd.DataFrame([[cell(x) for x in X0]], columns=names)
+    C, crisp, _ = fuzzy_pipeline(W_df, I_df, [names[k] for k in np.flatnonzero(clamp)], lam, ITERATIONS)
+    return np.array(C, dtype=float), np.array(crisp)
+
+
+@pytest.fixture(params=[False, True], ids=["numpy", "compiled"])
+def kernel(request, monkeypatch):
+    if request.param and not fuzzy_kernels.HAVE_NUMBA:
+        pytest.skip("numba is not installed")
+    monkeypatch.setattr(fuzzy_kernels, "USE_COMPILED", request.param)
+    return request.param
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_simulate_matches_reference(seed, kernel):
+    W, X0, clamp, lam = random_map(seed)
+    fuzzy_ref, crisp_ref = reference(W, X0, clamp, lam)
+    fuzzy_hist, crisp_hist = simulate(W, X0, clamp, lam, ITERATIONS)
+    np.testing.assert_allclose(fuzzy_hist, fuzzy_ref, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(crisp_hist, crisp_ref, rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_sparse_matches_reference(seed):
+    W, X0, clamp, lam = random_map(seed)
+    fuzzy_ref, crisp_ref = reference(W, X0, clamp, lam)
+    fuzzy_hist, crisp_hist = simulate(sparse_weights_from_dense(W), X0, clamp, lam, ITERATIONS)
+    np.testing.assert_allclose(fuzzy_hist, fuzzy_ref, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(crisp_hist, crisp_ref, rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize("sparse", [False, True], ids=["dense", "sparse"])
+def test_batch_matches_reference(sparse, kernel):
+    W, _, _, _ = random_map(0)
+    scenarios = [random_map(seed)[1:] for seed in SEEDS]
+    X0 = np.stack([s[0] for s in scenarios])
+    clamp = np.stack([s[1] for s in scenarios])
+    lam = np.array([s[2] for s in scenarios])
+    fuzzy_hist, crisp_hist = simulate_batch(sparse_weights_from_dense(W) if sparse else W,
+                                            X0, clamp, lam, ITERATIONS)
+    for b in range(len(X0)):
+        fuzzy_ref, crisp_ref = reference(W, X0[b], clamp[b], lam[b])
+        np.testing.assert_allclose(fuzzy_hist[b], fuzzy_ref, rtol=0, atol=1e-12)
+        np.testing.assert_allclose(crisp_hist[b], crisp_ref, rtol=0, atol=1e-12)
+
+
+def _edit_cases(W, X0, clamp, rng):
+    """(resimulate kwargs, W, X0, clamp of the equivalent full rerun) per kind of edit."""
+    n = len(X0)
+    tfn = np.sort(rng.uniform(-1, 1, 3))
+    W_edge = W.copy()
+    W_edge[2, 5] = tfn
+    yield {"edges": {(2, 5): tfn}}, W_edge, X0, clamp
+
+    W_cols = W.copy()
+    edges = {(0, j): tfn for j in range(1, n)}
+    W_cols[0, 1:] = tfn
+    yield {"edges": edges}, W_cols, X0, clamp
+
+    keep = np.setdiff1d(np.arange(n), [3])
+    yield {"remove": 3}, W[np.ix_(keep, keep)], X0[keep], clamp[keep]
+
+    row = np.sort(rng.uniform(-1, 1, (n, 3)), axis=-1)
+    col = np.sort(rng.uniform(-1, 1, (n, 3)), axis=-1)
+    W_add = np.zeros((n + 1, n + 1, 3))
+    W_add[:n, :n], W_add[n, :n], W_add[:n, n], W_add[n, n] = W, row, col, 1.0
+    x0 = (0.1, 0.2, 0.3)
+    yield ({"add": {"row": row, "col": col, "x0": x0}}, W_add,
+           np.vstack([X0, x0]), np.append(clamp, False))
+
+    new_clamp = ~clamp
+    yield {"clamp": new_clamp}, W, X0, new_clamp
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_resimulate_matches_full_rerun(seed, kernel):
+    W, X0, clamp, lam = random_map(seed)
+    run = simulate_cached(W, X0, clamp, lam, ITERATIONS)
+    rng = np.random.default_rng(seed + 100)
+    for edit, W_full, X0_full, clamp_full in _edit_cases(W, X0, clamp, rng):
+        updated = resimulate(run, **edit)
+        full = simulate_cached(W_full, X0_full, clamp_full, lam, ITERATIONS)
+        np.testing.assert_allclose(updated["W"], W_full, rtol=0, atol=0, err_msg=str(edit))
+        np.testing.assert_allclose(updated["fuzzy"], full["fuzzy"], rtol=0, atol=1e-12, err_msg=str(edit))
+        np.testing.assert_allclose(updated["crisp"], full["crisp"], rtol=0, atol=1e-12, err_msg=str(edit))
+
+
+def test_resimulate_rejects_sparse_run():
+    W, X0, clamp, lam = random_map(0)
+    run = simulate_cached(sparse_weights_from_dense(W), X0, clamp, lam, ITERATIONS)
+    with pytest.raises(ValueError, match="dense W"):
+        resimulate(run, remove=1)
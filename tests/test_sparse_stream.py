@@ -0,0 +1,46 @@
+import io
+import json
+
+import pytest
+
+from fuzzy_sparse import _JsonStream, iter_graph_elements, normalise_elements
+
+DOCUMENT = {
+    "zoom": 1.5,
+    "pan": {"x": -12.25e-1, "y": 3E+2},
+    "elements": {
+        "nodes": [{"data": {"id": "a", "label": "Ärger", "tfn": "0.1,0.2,0.3"}},
+                  {"data": {"id": "b", "label": "B", "tfn": "[0,0.5,1]"}}],
+        "edges": [{"data": {"source": "a", "target": "b", "tfn": "-0.25,0,0.25"}}],
+    },
+    "minZoom": 10,
+    "scale": 2.5e-3,
+    "version": -7,
+    "flag": True,
+}
+TEXT = json.dumps(DOCUMENT, ensure_ascii=False)
+CHUNKS = range(1, len(TEXT.encode()) + 2)
+
+
+def _open(binary):
+    return io.BytesIO(TEXT.encode()) if binary else io.StringIO(TEXT)
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_top_level_values_at_every_chunk_size(binary):
+    # Top-level values are decoded one at a time, so numbers can be cut by a chunk edge
+    for chunk in CHUNKS:
+        stream = _JsonStream(_open(binary), chunk)
+        assert {key: stream.value() for key in stream.keys()} == DOCUMENT, chunk
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_graph_elements_at_every_chunk_size(binary):
+    expected = normalise_elements(DOCUMENT)
+    for chunk in CHUNKS:
+        assert list(iter_graph_elements(_open(binary), chunk)) == expected, chunk
+
+
+def test_number_at_end_of_input():
+    for chunk in range(1, 6):
+        assert _JsonStream(io.StringIO("-1.5e3"), chunk).value() == -1500.0